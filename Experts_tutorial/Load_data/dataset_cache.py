@@ -0,0 +1,165 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Fingerprinted `tf.data` file caches.
+
+`dataset.cache(filename='./cache.tf-data')` reuses whatever is in the cache
+file, even after the input files or the preprocessing changed, and two jobs
+writing the same cache file at the same time conflict. `DatasetCache` keys
+every cache on a fingerprint of the input files (paths, sizes and
+modification times), of the source of the preprocessing functions and of a
+configuration dict, so any change makes a new cache.
+
+A cache is written completely in a private temporary directory and then
+renamed into place, so readers only ever see complete caches and concurrent
+jobs can share them. The least recently used caches are deleted when the
+caches take more than `max_bytes`.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+import uuid
+
+# Name of the cache files inside the directory of a cache
+_CACHE_PREFIX = 'cache'
+# File whose modification time is the last time a cache was used
+_LAST_USED = 'last_used'
+
+
+def _function_source(function):
+  try:
+    return inspect.getsource(function)
+  except (IOError, TypeError):
+    # no source, e.g. defined interactively, fall back to the bytecode
+    return repr(function.__code__.co_code) if hasattr(function, '__code__') else repr(function)
+
+
+def fingerprint(file_paths=(), functions=(), config=None):
+  """Hex digest of the input files, preprocessing functions and configuration of a dataset.
+
+  Args:
+    file_paths: input files, in the order the dataset reads them. Their sizes
+                and modification times are hashed, not their contents.
+    functions: preprocessing functions, their source is hashed.
+    config: JSON-serializable dict of other settings, e.g. the image size.
+
+  Returns:
+    a hex string.
+  """
+  digest = hashlib.sha256()
+  for path in file_paths:
+    path = path.decode('utf-8') if isinstance(path, bytes) else str(path)
+    stat = os.stat(path)
+    digest.update('{}\0{}\0{}\n'.format(path, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+  for function in functions:
+    digest.update(_function_source(function).encode('utf-8'))
+  digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+  return digest.hexdigest()
+
+
+class DatasetCache(object):
+  """Directory of fingerprinted `tf.data` file caches, evicted by LRU under a disk quota.
+
+  Args:
+    cache_dir: directory holding one sub-directory per cache.
+    max_bytes: disk quota of all the caches together.
+  """
+
+  def __init__(self, cache_dir, max_bytes=10 << 30):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key)
+
+  def contains(self, key):
+    return os.path.isdir(self._path(key))
+
+  def cache(self, dataset, key, description=None):
+    """`dataset` cached under `key`, writing the cache first if it does not exist yet.
+
+    Writing the cache iterates over the whole dataset once. The returned
+    dataset reads the cache files and never runs the ops of `dataset`.
+
+    Args:
+      dataset: finite `tf.data.Dataset` to cache, before any shuffling or repeating.
+      key: fingerprint of the dataset, see `fingerprint`.
+      description: optional JSON-serializable dict saved with the cache.
+
+    Returns:
+      the cached `tf.data.Dataset`.
+    """
+    path = self._path(key)
+    if not self.contains(key):
+      temp_path = os.path.join(self.cache_dir, '.tmp-{}-{}'.format(key, uuid.uuid4().hex))
+      os.makedirs(temp_path)
+      try:
+        for _ in dataset.cache(os.path.join(temp_path, _CACHE_PREFIX)):
+          pass
+        with open(os.path.join(temp_path, 'description.json'), 'w') as f:
+          json.dump(description, f)
+        open(os.path.join(temp_path, _LAST_USED), 'w').close()
+        try:
+          os.rename(temp_path, path)
+        except OSError:
+          # another job renamed the same cache into place first
+          if not self.contains(key):
+            raise
+      finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+      self.evict(keep=key)
+
+    os.utime(os.path.join(path, _LAST_USED))
+    return dataset.cache(os.path.join(path, _CACHE_PREFIX))
+
+  def entries(self):
+    """(key, last used time, size in bytes) of the complete caches, least recently used first."""
+    entries = []
+    for key in os.listdir(self.cache_dir):
+      path = self._path(key)
+      if key.startswith('.') or not os.path.isdir(path):
+        continue
+      try:
+        last_used = os.path.getmtime(os.path.join(path, _LAST_USED))
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+      except OSError:
+        # deleted by another job meanwhile
+        continue
+      entries.append((key, last_used, size))
+    return sorted(entries, key=lambda entry: entry[1])
+
+  def evict(self, keep=None):
+    """Delete the least recently used caches, other than `keep`, until they fit in `max_bytes`."""
+    entries = self.entries()
+    total = sum(size for _, _, size in entries)
+    for key, _, size in entries:
+      if total <= self.max_bytes:
+        break
+      if key == keep:
+        continue
+      shutil.rmtree(self._path(key), ignore_errors=True)
+      total -= size
+
+  def clear_stale(self, max_age=24 * 3600):
+    """Delete temporary directories left behind by jobs that died while writing a cache."""
+    now = time.time()
+    for name in os.listdir(self.cache_dir):
+      path = self._path(name)
+      if name.startswith('.tmp-') and now - os.path.getmtime(path) > max_age:
+        shutil.rmtree(path, ignore_errors=True)
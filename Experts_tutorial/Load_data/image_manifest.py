@@ -0,0 +1,217 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Cached manifests of the files of large image folders.
+
+`scan` lists a directory tree with a pool of threads, one directory per task,
+and records the path, size and modification time of every file in a
+`FileManifest`. The manifest is saved as a compact `.npz` file, and `scan`
+refreshes a previous manifest incrementally: a directory whose modification
+time did not change has the same entries, so only the changed directories are
+listed again. Files rewritten in place don't change their directory, pass
+`verify_files=True` to also check the size and time of every file.
+
+The label of a file is the name of the top-level directory it is in, like the
+`flower_photos/<label>/<image>` layout of `images.py`.
+"""
+
+import numpy as np
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _encode_strings(strings):
+  """A list of strings as a UTF-8 byte buffer and the (n + 1) offsets into it."""
+  encoded = [string.encode('utf-8') for string in strings]
+  offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+  np.cumsum([len(string) for string in encoded], out=offsets[1:])
+  return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(buffer, offsets):
+  data = buffer.tobytes()
+  return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+class FileManifest(object):
+  """The files of a directory tree, sorted by directory and name.
+
+  Attributes:
+    root: the directory tree.
+    dirs: relative paths of the directories, `''` is `root`.
+    dir_mtimes: modification time of every directory, in nanoseconds.
+    dir_ids: index into `dirs` of the directory of every file.
+    names: file names.
+    sizes: file sizes, in bytes.
+    mtimes: file modification times, in nanoseconds.
+  """
+
+  def __init__(self, root, dirs, dir_mtimes, dir_ids, names, sizes, mtimes, extensions=None):
+    self.root = str(root)
+    self.dirs = dirs
+    self.dir_mtimes = np.asarray(dir_mtimes, dtype=np.int64)
+    self.dir_ids = np.asarray(dir_ids, dtype=np.int32)
+    self.names = names
+    self.sizes = np.asarray(sizes, dtype=np.int64)
+    self.mtimes = np.asarray(mtimes, dtype=np.int64)
+    self.extensions = extensions
+
+  def __len__(self):
+    return len(self.names)
+
+  def paths(self):
+    """Full paths of the files."""
+    dirs = [os.path.join(self.root, directory) for directory in self.dirs]
+    return [os.path.join(dirs[dir_id], name) for dir_id, name in zip(self.dir_ids, self.names)]
+
+  def labels(self):
+    """(label names, label index of every file), files directly in `root` get label -1."""
+    top_level = [directory.split(os.sep)[0] for directory in self.dirs]
+    label_names = sorted(set(top_level[dir_id] for dir_id in np.unique(self.dir_ids)) - {''})
+    label_to_index = dict((name, index) for index, name in enumerate(label_names))
+    dir_labels = np.array([label_to_index.get(name, -1) for name in top_level], dtype=np.int32)
+    return label_names, dir_labels[self.dir_ids]
+
+  def save(self, path):
+    """Write the manifest to an `.npz` file, atomically."""
+    dir_buffer, dir_offsets = _encode_strings(self.dirs)
+    name_buffer, name_offsets = _encode_strings(self.names)
+    temp_path = '{}.tmp-{}.npz'.format(path, os.getpid())
+    np.savez(temp_path,
+             header=np.frombuffer(json.dumps({'root': self.root,
+                                              'extensions': self.extensions}).encode('utf-8'), dtype=np.uint8),
+             dir_buffer=dir_buffer, dir_offsets=dir_offsets, dir_mtimes=self.dir_mtimes,
+             dir_ids=self.dir_ids, name_buffer=name_buffer, name_offsets=name_offsets,
+             sizes=self.sizes, mtimes=self.mtimes)
+    os.replace(temp_path, path)
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path) as data:
+      header = json.loads(data['header'].tobytes().decode('utf-8'))
+      return cls(header['root'],
+                 _decode_strings(data['dir_buffer'], data['dir_offsets']),
+                 data['dir_mtimes'],
+                 data['dir_ids'],
+                 _decode_strings(data['name_buffer'], data['name_offsets']),
+                 data['sizes'],
+                 data['mtimes'],
+                 extensions=header['extensions'])
+
+
+def _list_directory(root, directory, extensions):
+  """(mtime, sub-directories, [(name, size, mtime)]) of a directory."""
+  path = os.path.join(root, directory)
+  mtime = os.stat(path).st_mtime_ns
+  subdirs = []
+  files = []
+  with os.scandir(path) as entries:
+    for entry in entries:
+      if entry.is_dir():
+        subdirs.append(os.path.join(directory, entry.name))
+      elif entry.is_file():
+        if extensions is None or os.path.splitext(entry.name)[1].lower() in extensions:
+          stat = entry.stat()
+          files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+  return mtime, sorted(subdirs), sorted(files)
+
+
+def scan(root, previous=None, extensions=None, num_threads=32, verify_files=False):
+  """List the files of a directory tree, reusing the unchanged directories of a previous manifest.
+
+  Args:
+    root: directory to list.
+    previous: optional `FileManifest` of an earlier scan of `root`.
+    extensions: only keep files with one of these lower-case extensions, e.g.
+                `('.jpg', '.jpeg')`, `None` keeps every file.
+    num_threads: number of directories listed at the same time.
+    verify_files: also check the size and modification time of the files of
+                  unchanged directories, and list a directory again if any changed.
+
+  Returns:
+    a `FileManifest`.
+  """
+  root = str(root)
+  extensions = sorted(extensions) if extensions is not None else None
+
+  known = {}
+  if previous is not None and previous.root == root and previous.extensions == extensions:
+    entries = [[] for _ in previous.dirs]
+    for dir_id, name, size, mtime in zip(previous.dir_ids, previous.names, previous.sizes, previous.mtimes):
+      entries[dir_id].append((name, int(size), int(mtime)))
+    children = dict((directory, []) for directory in previous.dirs)
+    for directory in previous.dirs:
+      if directory:
+        children[os.path.dirname(directory)].append(directory)
+    for i, directory in enumerate(previous.dirs):
+      known[directory] = (int(previous.dir_mtimes[i]), children[directory], entries[i])
+
+  def visit(directory):
+    if directory in known:
+      mtime, subdirs, files = known[directory]
+      try:
+        unchanged = os.stat(os.path.join(root, directory)).st_mtime_ns == mtime
+        if unchanged and verify_files:
+          for name, size, file_mtime in files:
+            stat = os.stat(os.path.join(root, directory, name))
+            if stat.st_size != size or stat.st_mtime_ns != file_mtime:
+              unchanged = False
+              break
+      except OSError:
+        unchanged = False
+      if unchanged:
+        return mtime, subdirs, files
+    return _list_directory(root, directory, extensions)
+
+  dirs, dir_mtimes, dir_ids, names, sizes, mtimes = [], [], [], [], [], []
+  level = ['']
+  with ThreadPoolExecutor(num_threads) as pool:
+    while level:
+      next_level = []
+      for directory, (mtime, subdirs, files) in zip(level, pool.map(visit, level)):
+        dir_id = len(dirs)
+        dirs.append(directory)
+        dir_mtimes.append(mtime)
+        for name, size, file_mtime in files:
+          dir_ids.append(dir_id)
+          names.append(name)
+          sizes.append(size)
+          mtimes.append(file_mtime)
+        next_level.extend(subdirs)
+      level = next_level
+
+  return FileManifest(root, dirs, dir_mtimes, dir_ids, names, sizes, mtimes, extensions=extensions)
+
+
+def load_or_scan(root, manifest_path, extensions=None, num_threads=32, refresh=True):
+  """The manifest of `root` saved at `manifest_path`, scanned and saved if missing.
+
+  Args:
+    root: directory to list.
+    manifest_path: `.npz` file of the manifest.
+    extensions: see `scan`.
+    num_threads: see `scan`.
+    refresh: update a saved manifest with `scan`, otherwise use it as it is.
+
+  Returns:
+    a `FileManifest`.
+  """
+  previous = FileManifest.load(manifest_path) if os.path.exists(manifest_path) else None
+  if previous is not None and not refresh:
+    return previous
+
+  manifest = scan(root, previous=previous, extensions=extensions, num_threads=num_threads)
+  manifest.save(manifest_path)
+  return manifest
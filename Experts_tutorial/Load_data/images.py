@@ -19,9 +19,23 @@ import tensorflow as tf
 from tensorflow.python import keras
 import pathlib
 
+import itertools
+import json
+import os
 import random
+import shutil
+import subprocess
+import sys
 import time
 
+import dataset_cache
+import image_manifest
+import jpeg_decode
+import pipeline_benchmark
+import pipeline_tuner
+import tfrecord_io
+import tfrecord_shards
+
 AUTOTUNE = tf.data.experimental.AUTOTUNE
 
 # Load data
@@ -30,9 +44,15 @@ data_root_orig = keras.utils.get_file(
   fname='flower_photos', untar=True)
 data_root = pathlib.Path(data_root_orig)
 
-all_image_paths = list(data_root.glob('*/*'))
-all_image_paths = [str(path) for path in all_image_paths]
-random.shuffle(all_image_paths)
+# List the images with a pool of threads, and keep the list in a manifest next
+# to the data: later runs only list the directories that changed since.
+image_files = image_manifest.load_or_scan(data_root, str(data_root) + '.manifest.npz',
+                                          extensions=('.jpg', '.jpeg', '.png'))
+label_names, image_file_labels = image_files.labels()
+
+all_images = list(zip(image_files.paths(), image_file_labels.tolist()))
+random.shuffle(all_images)
+all_image_paths = [path for path, _ in all_images]
 image_count = len(all_image_paths)
 
 # Check images
@@ -40,15 +60,11 @@ attributions = (data_root / "LICENSE.txt").open(encoding='utf-8').readlines()[4:
 attributions = [line.split(' CC-BY') for line in attributions]
 attributions = dict(attributions)
 
-# Identify the label for each image
-label_names = sorted(item.name for item in data_root.glob('*/') if item.is_dir())
-
-# Assign an index to each label.
+# The label of each image is the index of its directory in `label_names`.
 label_to_index = dict((name, index) for index, name in enumerate(label_names))
 
 # Create a list of each file and its label index
-all_image_labels = [label_to_index[pathlib.Path(path).parent.name]
-                  for path in all_image_paths]
+all_image_labels = [label for _, label in all_images]
 
 # Loads and formats images
 img_path = all_image_paths[0]
@@ -61,7 +77,8 @@ img_final = img_final / 255.
 
 
 def preprocess_image(image):
-  image = tf.image.decode_jpeg(image, channels=3)
+  # decode at the smallest DCT scale that is still at least 192x192
+  image = jpeg_decode.decode_jpeg(image, [192, 192], channels=3)
   image = tf.image.resize(image, [192, 192])
   image /= 255.  # normalize to [0,1] range
 
@@ -156,23 +173,16 @@ default_timeit_steps = 2 * steps_per_epoch + 1
 
 
 def timeit(ds, steps=default_timeit_steps):
-  overall_start = time.time()
-  # Fetch a single batch to prime the pipeline (fill the shuffle buffer),
-  # before starting the timer
-  it = iter(ds.take(steps + 1))
-  next(it)
+  # A single batch primes the pipeline (fills the shuffle buffer) before the
+  # timer starts, see `pipeline_benchmark.benchmark` for the other measures.
+  steps = int(steps)
+  result = pipeline_benchmark.benchmark(ds, steps, warmup_steps=1)
 
-  start = time.time()
-  for i, (_, _) in enumerate(it):
-      if i % 10 == 0:
-          print('.', end='')
-  print()
-  end = time.time()
-
-  duration = end - start
+  duration = steps / result['batches_per_sec']
   print("{} batches: {} s".format(steps, duration))
-  print("{:0.5f} Images/s".format(BATCH_SIZE * steps / duration))
-  print("Total time: {}s".format(end - overall_start))
+  print("{:0.5f} Images/s".format(result['elements_per_sec']))
+  print("Total time: {}s".format(result['warmup_sec'] + duration))
+  return result
 
 
 # The performance of the current dataset is.
@@ -258,6 +268,50 @@ timeit(ds)
 Total time: 2.96774959564209s
 """
 
+# The cache file is reused even if the image files or `preprocess_image`
+# change, and it is not safe to share between jobs. `DatasetCache` keys the
+# cache on a fingerprint of the image files, of the preprocessing functions and
+# of the image size, writes it atomically, and deletes the least recently used
+# caches over the disk quota.
+image_cache = dataset_cache.DatasetCache('./dataset_cache', max_bytes=5 << 30)
+cache_key = dataset_cache.fingerprint(all_image_paths,
+                                      functions=[load_and_preprocess_image, preprocess_image],
+                                      config={'image_size': [192, 192]})
+ds = image_cache.cache(image_label_ds, cache_key)
+ds = ds.apply(
+  tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+ds = ds.batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+print()
+print(f'Add fingerprinted file cache pipe:')
+print()
+timeit(ds)
+
+# Reduced-resolution decoding
+# `preprocess_image` decodes every JPEG at 1/2, 1/4 or 1/8 of its size when that
+# is still at least 192x192, instead of decoding it fully and then resizing it.
+# Compare it with the full decode on the basic pipe:
+def preprocess_image_full_decode(image):
+  image = tf.image.decode_jpeg(image, channels=3)
+  image = tf.image.resize(image, [192, 192])
+  image /= 255.  # normalize to [0,1] range
+
+  return image
+
+
+for name, preprocess in [('full', preprocess_image_full_decode), ('reduced', preprocess_image)]:
+  ds = tf.data.Dataset.from_tensor_slices((all_image_paths, all_image_labels))
+  ds = ds.map(lambda path, label: (preprocess(tf.io.read_file(path)), label),
+              num_parallel_calls=AUTOTUNE)
+  ds = ds.apply(
+    tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+  ds = ds.batch(BATCH_SIZE).prefetch(buffer_size=AUTOTUNE)
+
+  print()
+  print(f'Basic pipe ({name} resolution decode):')
+  print()
+  timeit(ds)
+
 # ==========================Performance==========================================
 
 # ==========================TFRecord File========================================
@@ -329,4 +383,183 @@ timeit(ds)
 Total time: 2.6123740673065186s
 """
 
+# Compact uint8 tensors
+# The serialized tensors above are float32, 4 bytes per channel of every pixel.
+# Storing the resized images as uint8 takes a quarter of the bytes, and the
+# records can also be GZIP or ZLIB compressed. The conversion to float32 and
+# the normalization then run in-graph once per batch.
+def load_and_resize_uint8(path):
+  image = tf.image.decode_jpeg(tf.io.read_file(path), channels=3)
+  image = tf.image.resize(image, [192, 192])
+  return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def parse_uint8(x):
+  result = tf.io.parse_tensor(x, out_type=tf.uint8)
+  result = tf.reshape(result, [192, 192, 3])
+  return result
+
+
+def normalize_batch(images, labels):
+  return tf.cast(images, tf.float32) / 255., labels
+
+
+print('float32 tensor: {:.0f} bytes/image'.format(os.path.getsize('images.tfrec') / image_count))
+
+uint8_ds = paths_ds.map(load_and_resize_uint8, num_parallel_calls=AUTOTUNE)
+uint8_ds = uint8_ds.map(tf.io.serialize_tensor)
+
+for compression in ['', 'GZIP', 'ZLIB']:
+  record_file = 'images_uint8{}.tfrec'.format('.' + compression.lower() if compression else '')
+  tfrec = tf.data.experimental.TFRecordWriter(record_file, compression_type=compression)
+  tfrec.write(uint8_ds)
+
+  ds = tf.data.TFRecordDataset(record_file, compression_type=compression)
+  ds = ds.map(parse_uint8, num_parallel_calls=AUTOTUNE)
+  ds = tf.data.Dataset.zip((ds, label_ds))
+  ds = ds.apply(
+    tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+  ds = ds.batch(BATCH_SIZE).map(normalize_batch, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+  print()
+  print(f'Add tfrecord pipe (uint8 tensor, {compression or "uncompressed"}):')
+  print('{:.0f} bytes/image'.format(os.path.getsize(record_file) / image_count))
+  print()
+  timeit(ds)
+
+# Sharded TFRecord files
+# The TFRecord files above are written by a single core. `tfrecord_shards.py`
+# splits the images into shards of about `target_shard_mb` megabytes, balanced
+# on the file sizes, and writes them from a pool of worker processes, followed
+# by a manifest listing the shards. Its workers are spawned and re-import the
+# main module, so it runs as a separate script; the times include its start-up.
+os.makedirs('image_shards', exist_ok=True)
+with open('image_shards/flowers.json', 'w') as f:
+  json.dump(list(zip(all_image_paths, all_image_labels)), f)
+
+for num_workers in sorted({1, os.cpu_count()}):
+  start = time.time()
+  subprocess.run([sys.executable, tfrecord_shards.__file__, '--image_list', 'image_shards/flowers.json',
+                  '--output_prefix', 'image_shards/flowers', '--target_shard_mb', '20',
+                  '--num_workers', str(num_workers)], check=True)
+  manifest = tfrecord_shards.read_manifest('image_shards/flowers.manifest.json')
+  print('{} workers: {} shards in {:.2f} s'.format(num_workers, len(manifest['shards']),
+                                                   time.time() - start))
+
+# `manifest_dataset` reads several shards at the same time with `interleave`.
+image_shard_description = {
+  'image_raw': tf.io.FixedLenFeature([], tf.string),
+  'label': tf.io.FixedLenFeature([], tf.int64),
+}
+
+
+def parse_image_record(record):
+  features = tf.io.parse_single_example(record, image_shard_description)
+  return preprocess_image(features['image_raw']), features['label']
+
+
+ds = tfrecord_io.manifest_dataset('image_shards/flowers.manifest.json')
+ds = ds.map(parse_image_record, num_parallel_calls=AUTOTUNE)
+ds = ds.apply(
+  tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+ds = ds.batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+print()
+print(f'Add sharded tfrecord pipe (basic tensor):')
+print()
+timeit(ds)
+
 # ==========================TFRecord File========================================
+
+# ==========================Benchmark============================================
+
+# Run the pipelines above side by side with the same number of steps, and
+# compare them with the results of a previous run. The first run stores its
+# results as the baseline, later runs raise `RegressionError` when a pipeline
+# got more than 10% slower.
+def shuffled_batches(ds):
+  ds = ds.apply(
+    tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+  return ds.batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+
+def tfrecord_pipe():
+  ds = tfrecord_io.manifest_dataset('image_shards/flowers.manifest.json')
+  return shuffled_batches(ds.map(parse_image_record, num_parallel_calls=AUTOTUNE))
+
+
+def serialized_tensor_pipe():
+  ds = tf.data.TFRecordDataset('images.tfrec').map(parse, num_parallel_calls=AUTOTUNE)
+  return shuffled_batches(tf.data.Dataset.zip((ds, label_ds)))
+
+
+pipeline_variants = {
+  'basic': lambda: shuffled_batches(image_label_ds),
+  'memory cache': lambda: shuffled_batches(image_label_ds.cache()),
+  'file cache': lambda: shuffled_batches(image_label_ds.cache(filename='./cache.tf-data')),
+  'tfrecord': tfrecord_pipe,
+  'serialized tensor': serialized_tensor_pipe,
+}
+
+benchmark_results = pipeline_benchmark.run_variants(pipeline_variants, int(default_timeit_steps))
+pipeline_benchmark.save_results(benchmark_results, 'images_benchmark.json')
+pipeline_benchmark.compare_to_baseline(benchmark_results, 'images_benchmark_baseline.json')
+
+# ==========================Tuning===============================================
+
+# The pipelines above use hand-picked values like `prefetch(1)` and
+# `BATCH_SIZE`. `pipeline_tuner.tune` searches these knobs with short timed runs
+# of the TFRecord pipeline below and saves the fastest configuration for this
+# type of machine, which later runs load instead of tuning again. Runs of 50
+# batches are shorter than an epoch, too short to tell whether a cache pays
+# off, so the `cache` knob is left out of the search.
+parse_image_batch_description = image_shard_description
+tuner_cache_files = itertools.count()
+
+
+def parse_image_batch(records):
+  features = tf.io.parse_example(records, parse_image_batch_description)
+  images = tf.map_fn(preprocess_image, features['image_raw'], dtype=tf.float32)
+  return images, features['label']
+
+
+def build_image_pipeline(config):
+  ds = tfrecord_io.manifest_dataset('image_shards/flowers.manifest.json',
+                                    cycle_length=config['cycle_length'])
+  if not config['batch_before_map']:
+    ds = ds.map(parse_image_record, num_parallel_calls=config['num_parallel_calls'])
+
+  if config.get('cache') == 'memory':
+    ds = ds.cache()
+  elif config.get('cache') == 'file':
+    os.makedirs('tuner_cache', exist_ok=True)
+    ds = ds.cache(filename='tuner_cache/{}.tf-data'.format(next(tuner_cache_files)))
+
+  ds = ds.apply(
+    tf.data.experimental.shuffle_and_repeat(buffer_size=image_count))
+  ds = ds.batch(config['batch_size'])
+  if config['batch_before_map']:
+    ds = ds.map(parse_image_batch, num_parallel_calls=config['num_parallel_calls'])
+  return ds.prefetch(config['prefetch'])
+
+
+def remove_tuner_caches():
+  shutil.rmtree('tuner_cache', ignore_errors=True)
+
+
+image_search_space = dict((knob, values) for knob, values in pipeline_tuner.DEFAULT_SEARCH_SPACE.items()
+                          if knob != 'cache')
+tuned_config_path = pipeline_tuner.host_config_path('tuned_pipelines')
+tuned_config = pipeline_tuner.load_config(tuned_config_path)
+if tuned_config is None:
+  tuned_config, tuned_result, _ = pipeline_tuner.tune(build_image_pipeline, image_search_space, steps=50,
+                                                      cleanup=remove_tuner_caches)
+  pipeline_tuner.save_config(tuned_config, tuned_result, tuned_config_path)
+print('Tuned pipeline:', tuned_config)
+
+print()
+print(f'Tuned tfrecord pipe:')
+print()
+timeit(build_image_pipeline(tuned_config))
+
+remove_tuner_caches()
@@ -0,0 +1,107 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Reduced-resolution JPEG decoding for image input pipelines.
+
+A JPEG can be decoded directly at 1/2, 1/4 or 1/8 of its size by scaling in
+the DCT domain, which skips most of the decoding work. `decode_jpeg` reads the
+image size from the JPEG header and picks the smallest scale that is still at
+least the target size, so the following `tf.image.resize` only ever shrinks
+the image, like it does after a full decode. With a crop window, only the
+window is decoded.
+
+Used by `images.py`, `generative/pix2pix.py` and `Text/image_captioning.py`.
+"""
+
+import tensorflow as tf
+
+# Scale denominators supported by the JPEG decoder
+RATIOS = (1, 2, 4, 8)
+
+
+def decode_ratio(image_size, target_size, max_upscale=1.0):
+  """Largest of `RATIOS` at which an image of `image_size` still covers `target_size`.
+
+  Args:
+    image_size: [height, width] int32 tensor.
+    target_size: [height, width] the image is resized to after decoding.
+    max_upscale: the decoded image may be this many times smaller than
+                 `target_size`, trading quality for decoding speed.
+
+  Returns:
+    an int32 scalar tensor.
+  """
+  image_size = tf.cast(image_size, tf.float32)
+  needed = tf.math.ceil(tf.cast(target_size, tf.float32) / max_upscale)
+  ratio = tf.constant(1, dtype=tf.int32)
+  for r in RATIOS[1:]:
+    # the decoder rounds the scaled size up
+    fits = tf.reduce_all(tf.math.ceil(image_size / r) >= needed)
+    ratio = tf.where(fits, r, ratio)
+  return ratio
+
+
+def decode_jpeg(contents, target_size=None, channels=3, crop_window=None, max_upscale=1.0):
+  """Decode a JPEG at the smallest scale that covers `target_size`.
+
+  Args:
+    contents: JPEG encoded string scalar.
+    target_size: [height, width] the image will be resized to, `None` decodes
+                 at full resolution.
+    channels: number of color channels of the decoded image.
+    crop_window: optional [y, x, height, width] int32 window, in full
+                 resolution pixels, to decode instead of the whole image.
+    max_upscale: see `decode_ratio`.
+
+  Returns:
+    a uint8 image tensor, of about `1 / ratio` of the full (or cropped) size.
+  """
+  if target_size is None and crop_window is None:
+    return tf.io.decode_jpeg(contents, channels=channels)
+
+  if crop_window is not None:
+    crop_window = tf.cast(crop_window, tf.int32)
+    image_size = crop_window[2:]
+  else:
+    image_size = tf.io.extract_jpeg_shape(contents)[:2]
+
+  if target_size is not None:
+    ratio = decode_ratio(image_size, target_size, max_upscale)
+  else:
+    ratio = tf.constant(1, dtype=tf.int32)
+
+  def decode(r):
+    def fn():
+      if crop_window is None:
+        return tf.io.decode_jpeg(contents, channels=channels, ratio=r)
+      # the crop window is in the coordinates of the scaled image
+      window = tf.concat([crop_window[:2] // r, tf.maximum(crop_window[2:] // r, 1)], axis=0)
+      return tf.io.decode_and_crop_jpeg(contents, window, channels=channels, ratio=r)
+    return fn
+
+  branch = tf.argmax(tf.cast(tf.equal(tf.constant(RATIOS), ratio), tf.int32), output_type=tf.int32)
+  image = tf.switch_case(branch, [decode(r) for r in RATIOS])
+  image.set_shape([None, None, channels or None])
+  return image
+
+
+def load_and_resize(path, target_size, channels=3, crop_window=None, max_upscale=1.0):
+  """Read a JPEG file, decode it at reduced resolution and resize it to `target_size`.
+
+  Returns:
+    a float32 image with values in [0, 255], like `tf.image.resize` of a full decode.
+  """
+  image = decode_jpeg(tf.io.read_file(path), target_size, channels=channels,
+                      crop_window=crop_window, max_upscale=max_upscale)
+  return tf.image.resize(image, target_size)
@@ -0,0 +1,170 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmarks of `tf.data` input pipelines.
+
+`benchmark` generalizes `timeit` of `images.py` to any dataset: it measures the
+warm-up time until the first batches, the steady-state throughput, the
+percentiles of the time to get every batch and the growth of the resident
+memory. `run_variants` benchmarks named pipeline variants side by side,
+`save_results` writes the results as JSON, and `compare_to_baseline` raises
+`RegressionError` when a variant got slower than in stored results.
+"""
+
+import tensorflow as tf
+
+import numpy as np
+import json
+import os
+import resource
+import time
+
+
+class RegressionError(AssertionError):
+  """A pipeline is slower than its baseline."""
+
+
+def _rss_bytes():
+  """Resident memory of this process, in bytes."""
+  try:
+    with open('/proc/self/statm', 'r') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (IOError, ValueError):
+    # peak instead of current memory, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _batch_size(element):
+  tensor = tf.nest.flatten(element)[0]
+  return int(tensor.shape[0]) if tensor.shape.rank else 1
+
+
+def benchmark(dataset, steps, warmup_steps=1):
+  """Iterate over `warmup_steps + steps` elements of a dataset and time them.
+
+  Args:
+    dataset: `tf.data.Dataset` of batches, with at least `warmup_steps + steps` of them.
+    steps: number of timed batches.
+    warmup_steps: batches fetched before timing, e.g. to fill a shuffle buffer.
+
+  Returns:
+    a dict with the `warmup_sec`, the steady-state `elements_per_sec` and
+    `batches_per_sec`, the `latency_ms` percentiles of the time to get a batch
+    and the `memory_growth_mb` over the timed batches.
+  """
+  start = time.time()
+  iterator = iter(dataset.take(warmup_steps + steps))
+  for _ in range(warmup_steps):
+    next(iterator)
+  warmup = time.time() - start
+
+  memory = _rss_bytes()
+  latencies = []
+  num_elements = 0
+  steady_start = time.time()
+  batch_start = steady_start
+  for element in iterator:
+    now = time.time()
+    latencies.append(now - batch_start)
+    num_elements += _batch_size(element)
+    batch_start = now
+  duration = time.time() - steady_start
+
+  if len(latencies) < steps:
+    raise ValueError('The dataset ended after {} of {} steps'.format(len(latencies), steps))
+
+  latencies_ms = np.array(latencies) * 1000
+  return {'warmup_sec': warmup,
+          'steps': steps,
+          'elements_per_sec': num_elements / duration,
+          'batches_per_sec': steps / duration,
+          'latency_ms': {'mean': float(latencies_ms.mean()),
+                         'p50': float(np.percentile(latencies_ms, 50)),
+                         'p90': float(np.percentile(latencies_ms, 90)),
+                         'p99': float(np.percentile(latencies_ms, 99)),
+                         'max': float(latencies_ms.max())},
+          'memory_growth_mb': (_rss_bytes() - memory) / 2 ** 20}
+
+
+def print_results(results):
+  print('{:<24}{:>12}{:>14}{:>10}{:>10}{:>10}{:>12}'.format(
+    'variant', 'warm-up (s)', 'elements/s', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'memory (MB)'))
+  for name, result in results.items():
+    print('{:<24}{:>12.2f}{:>14.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>12.1f}'.format(
+      name, result['warmup_sec'], result['elements_per_sec'], result['latency_ms']['p50'],
+      result['latency_ms']['p90'], result['latency_ms']['p99'], result['memory_growth_mb']))
+
+
+def run_variants(variants, steps, warmup_steps=1):
+  """Benchmark named pipeline variants one after the other.
+
+  Args:
+    variants: dict from a variant name to a function building its dataset,
+              called right before the variant is benchmarked.
+    steps: see `benchmark`.
+    warmup_steps: see `benchmark`.
+
+  Returns:
+    a dict from variant name to the results of `benchmark`.
+  """
+  results = {}
+  for name, build in variants.items():
+    results[name] = benchmark(build(), steps, warmup_steps=warmup_steps)
+  print_results(results)
+  return results
+
+
+def save_results(results, path):
+  with open(path, 'w') as f:
+    json.dump(results, f, indent=2)
+
+
+def load_results(path):
+  with open(path, 'r') as f:
+    return json.load(f)
+
+
+def compare_to_baseline(results, baseline_path, tolerance=0.1):
+  """Check results against the baseline results stored in `baseline_path`.
+
+  Variants missing from the baseline are skipped. If there is no baseline
+  file yet, `results` are saved as the baseline.
+
+  Args:
+    results: dict from variant name to the results of `benchmark`.
+    baseline_path: JSON file written by `save_results`.
+    tolerance: allowed relative loss of throughput and increase of p90 latency.
+
+  Raises:
+    RegressionError: listing every variant slower than its baseline.
+  """
+  if not os.path.exists(baseline_path):
+    save_results(results, baseline_path)
+    return
+
+  baseline = load_results(baseline_path)
+  regressions = []
+  for name, result in results.items():
+    if name not in baseline:
+      continue
+    expected = baseline[name]
+    if result['elements_per_sec'] < expected['elements_per_sec'] * (1 - tolerance):
+      regressions.append('{}: {:.1f} elements/s, baseline {:.1f}'.format(
+        name, result['elements_per_sec'], expected['elements_per_sec']))
+    if result['latency_ms']['p90'] > expected['latency_ms']['p90'] * (1 + tolerance):
+      regressions.append('{}: p90 latency {:.2f} ms, baseline {:.2f} ms'.format(
+        name, result['latency_ms']['p90'], expected['latency_ms']['p90']))
+
+  if regressions:
+    raise RegressionError('Slower than {}:\n  {}'.format(baseline_path, '\n  '.join(regressions)))
@@ -0,0 +1,136 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tune the knobs of a `tf.data` input pipeline for the current machine.
+
+A pipeline is described by a builder function taking a configuration dict,
+e.g. `{'num_parallel_calls': 4, 'prefetch': 2, 'batch_size': 64, ...}`, and
+a search space listing the values to try for every knob. `tune` times short
+runs of the pipeline with `pipeline_benchmark.benchmark` and searches the
+space one knob at a time: every value of a knob is tried with the best values
+found so far for the others, and passes over all the knobs are repeated until
+none of them changes.
+
+The best configuration is written to a JSON file named after the host type,
+see `host_config_path`, so every type of machine gets its own tuned
+configuration.
+"""
+
+import tensorflow as tf
+
+import json
+import os
+import platform
+
+import pipeline_benchmark
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+# The knobs of a typical pipeline
+DEFAULT_SEARCH_SPACE = {
+  'num_parallel_calls': [1, 2, 4, 8, AUTOTUNE],
+  'prefetch': [1, 2, AUTOTUNE],
+  'cache': [None, 'memory', 'file'],
+  'cycle_length': [1, 2, 4, 8],
+  'batch_size': [32, 64, 128],
+  'batch_before_map': [False, True],
+}
+
+
+def host_config_path(directory):
+  """Path of the tuned configuration of this type of host: machine, CPU count and GPU count."""
+  num_gpus = len(tf.config.experimental.list_physical_devices('GPU'))
+  name = '{}-{}cpu-{}gpu.json'.format(platform.machine(), os.cpu_count(), num_gpus)
+  return os.path.join(directory, name)
+
+
+def tune(build, search_space=None, steps=20, warmup_steps=2, max_passes=2, initial_config=None,
+         cleanup=None):
+  """Search the configuration of the fastest pipeline.
+
+  Short runs favour knobs with a low start-up cost: `steps` should be large
+  enough for the pipeline to reach its steady state, and to complete an epoch
+  if caches are tuned.
+
+  Args:
+    build: function from a configuration dict to a `tf.data.Dataset` of batches.
+    search_space: dict from knob name to the list of values to try, defaults
+                  to `DEFAULT_SEARCH_SPACE`.
+    steps: batches timed per trial.
+    warmup_steps: batches fetched before timing every trial.
+    max_passes: maximum number of passes over all the knobs.
+    initial_config: starting configuration, defaults to the first value of every knob.
+    cleanup: optional function called after every trial, e.g. to delete the
+             cache files the trial wrote.
+
+  Returns:
+    (best configuration, its `benchmark` results, list of all the
+    (configuration, results) trials, with `None` results for failed trials).
+  """
+  search_space = search_space if search_space is not None else DEFAULT_SEARCH_SPACE
+  config = dict(initial_config) if initial_config is not None else \
+    {knob: values[0] for knob, values in search_space.items()}
+
+  trials = []
+  measured = {}
+
+  def measure(config):
+    key = json.dumps(config, sort_keys=True)
+    if key not in measured:
+      try:
+        result = pipeline_benchmark.benchmark(build(config), steps, warmup_steps=warmup_steps)
+      except (tf.errors.OpError, ValueError) as e:
+        print('{} failed: {}'.format(key, e))
+        result = None
+      else:
+        print('{}: {:.1f} elements/s'.format(key, result['elements_per_sec']))
+      finally:
+        if cleanup is not None:
+          cleanup()
+      measured[key] = result
+      trials.append((dict(config), result))
+    return measured[key]
+
+  best = measure(config)
+  for _ in range(max_passes):
+    changed = False
+    for knob, values in search_space.items():
+      for value in values:
+        if value == config[knob]:
+          continue
+        candidate = dict(config, **{knob: value})
+        result = measure(candidate)
+        if result is not None and (best is None or result['elements_per_sec'] > best['elements_per_sec']):
+          config, best, changed = candidate, result, True
+    if not changed:
+      break
+
+  return config, best, trials
+
+
+def save_config(config, result, path):
+  """Write a tuned configuration and its benchmark results."""
+  directory = os.path.dirname(path)
+  if directory:
+    os.makedirs(directory, exist_ok=True)
+  with open(path, 'w') as f:
+    json.dump({'config': config, 'result': result}, f, indent=2)
+
+
+def load_config(path, default=None):
+  """The tuned configuration saved at `path`, or `default` if there is none."""
+  if not os.path.exists(path):
+    return default
+  with open(path, 'r') as f:
+    return json.load(f)['config']
@@ -0,0 +1,92 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Ragged batches for the Iliad line classifier in `text.py`.
+
+`padded_batch` pads every line of a batch to the longest one, and the
+bidirectional LSTM then runs over the padding in both directions. Ragged
+batches keep the real line lengths through the embedding, and the LSTM uses
+them as sequence lengths, so padded timesteps cost nothing.
+"""
+
+import tensorflow as tf
+
+import numpy as np
+import time
+
+import vocabulary
+
+
+def ragged_batches(dataset, batch_size):
+  """Batch (encoded line, label) pairs into (`tf.RaggedTensor`, labels) batches."""
+  return dataset.apply(tf.data.experimental.dense_to_ragged_batch(batch_size))
+
+
+def build_model(vocab_size, ragged=True):
+  """The classifier of `text.py`, on ragged or on padded batches."""
+  inputs = tf.keras.Input(shape=[None], dtype=tf.int64, ragged=ragged)
+  x = tf.keras.layers.Embedding(vocab_size, 64)(inputs)
+  x = tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(64))(x)
+  for units in [64, 64]:
+    x = tf.keras.layers.Dense(units, activation='relu')(x)
+  outputs = tf.keras.layers.Dense(3, activation='softmax')(x)
+
+  model = tf.keras.Model(inputs, outputs)
+  model.compile(optimizer='adam',
+                loss='sparse_categorical_crossentropy',
+                metrics=['accuracy'])
+  return model
+
+
+def line_lengths(paths):
+  """Number of words of every line of the text files in `paths`."""
+  lines = tf.data.TextLineDataset(paths).batch(1024)
+  lengths = lines.map(lambda batch: vocabulary.tokenize(batch).row_lengths(),
+                      num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  return np.concatenate([batch.numpy() for batch in lengths])
+
+
+def synthetic_lines(lengths, num_lines, vocab_size, seed=0):
+  """Random (line, label) pairs whose lengths follow the empirical `lengths`."""
+  rng = np.random.RandomState(seed)
+  sampled = np.maximum(rng.choice(lengths, num_lines), 1)
+  starts = np.concatenate([[0], np.cumsum(sampled)[:-1]]).astype(np.int64)
+  flat = tf.constant(rng.randint(1, vocab_size, sampled.sum()).astype(np.int64))
+  labels = rng.randint(0, 3, num_lines).astype(np.int64)
+
+  dataset = tf.data.Dataset.from_tensor_slices((starts, sampled.astype(np.int64), labels))
+  return dataset.map(lambda start, length, label: (tf.slice(flat, [start], [length]), label))
+
+
+def benchmark(lines, vocab_size, batch_size=32):
+  """Seconds per epoch of the padded and the ragged pipelines on `lines`.
+
+  The first epoch of each model traces the model and is not counted.
+  """
+  lines = lines.cache()
+  pipelines = {
+    'padded': (lines.padded_batch(batch_size, padded_shapes=([-1], [])), False),
+    'ragged': (ragged_batches(lines, batch_size), True),
+  }
+
+  results = {}
+  for name, (batches, ragged) in pipelines.items():
+    model = build_model(vocab_size, ragged=ragged)
+    model.fit(batches, epochs=1, verbose=0)
+
+    start = time.time()
+    model.fit(batches, epochs=1, verbose=0)
+    results[name] = time.time() - start
+    print('{}: {:.2f} sec/epoch'.format(name, results[name]))
+  return results
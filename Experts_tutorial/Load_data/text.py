@@ -18,10 +18,12 @@
 
 # Setup
 import tensorflow as tf
-import tensorflow_datasets as tfds
 
 import os
 
+import ragged_text
+import vocabulary
+
 DIRECTORY_URL = 'https://storage.googleapis.com/download.tensorflow.org/data/illiad/'
 FILE_NAMES = ['cowper.txt', 'derby.txt', 'butler.txt']
 
@@ -57,38 +59,32 @@ all_labeled_data = all_labeled_data.shuffle(
   BUFFER_SIZE, reshuffle_each_iteration=False)
 
 # Encode text lines as numbers
-tokenizer = tfds.features.text.Tokenizer()
-
-vocabulary_set = set()
-for text_tensor, _ in all_labeled_data:
-  some_tokens = tokenizer.tokenize(text_tensor.numpy())
-  vocabulary_set.update(some_tokens)
+# Count the words of every line in one parallel tf.data pass, and write the vocabulary to a file.
+vocab_path = os.path.join(parent_dir, 'iliad_vocab.txt')
+vocabulary_list = vocabulary.build_vocabulary(all_labeled_data.map(lambda text, label: text), vocab_path)
 
-vocab_size = len(vocabulary_set)
+# The vocabulary size counts the padding id and the out-of-vocabulary id
+vocab_size = vocabulary.vocab_size(vocabulary_list)
 print(vocab_size)
 
-# Encode examples
-encoder = tfds.features.text.TokenTextEncoder(vocabulary_set)
+# Encode examples with a static hash table built from the vocabulary file
+table = vocabulary.lookup_table(vocab_path)
 
 # You can try this on a single line to see what the output looks like.
-example_text = next(iter(all_labeled_data))[0].numpy()
-print(example_text)
-
-encoded_example = encoder.encode(example_text)
-print(encoded_example)
+example_text = next(iter(all_labeled_data))[0]
+print(example_text.numpy())
 
-
-# Now run the encoder on the dataset by wrapping it in tf.py_function and passing that to the dataset's map method.
-def encode(text_tensor, label):
-  encoded_text = encoder.encode(text_tensor.numpy())
-  return encoded_text, label
+encoded_example = vocabulary.encode(table, example_text)
+print(encoded_example.numpy())
 
 
+# Now encode the whole dataset with the dataset's map method. The lookup is a TensorFlow op,
+# so the lines are encoded in parallel, without tf.py_function.
 def encode_map_fn(text, label):
-  return tf.py_function(encode, inp=[text, label], Tout=(tf.int64, tf.int64))
+  return vocabulary.encode(table, text), label
 
 
-all_encoded_data = all_labeled_data.map(encode_map_fn)
+all_encoded_data = all_labeled_data.map(encode_map_fn, num_parallel_calls=tf.data.experimental.AUTOTUNE)
 
 # Split the dataset into text and train batches
 train_data = all_encoded_data.skip(TAKE_SIZE).shuffle(BUFFER_SIZE)
@@ -123,3 +119,24 @@ model.fit(train_data, epochs=3, validation_data=test_data)
 eval_loss, eval_acc = model.evaluate(test_data)
 
 print('\nEval loss: {}, Eval accuracy: {}'.format(eval_loss, eval_acc))
+
+
+# Ragged batches
+# padded_batch pads every line to the longest line of its batch, and the
+# bidirectional LSTM runs over that padding in both directions. Ragged batches
+# keep the real lengths through the embedding and the LSTM.
+ragged_train_data = ragged_text.ragged_batches(all_encoded_data.skip(TAKE_SIZE).shuffle(BUFFER_SIZE),
+                                               BATCH_SIZE)
+ragged_test_data = ragged_text.ragged_batches(all_encoded_data.take(TAKE_SIZE), BATCH_SIZE)
+
+ragged_model = ragged_text.build_model(vocab_size, ragged=True)
+ragged_model.fit(ragged_train_data, epochs=3, validation_data=ragged_test_data)
+
+eval_loss, eval_acc = ragged_model.evaluate(ragged_test_data)
+
+print('\nRagged eval loss: {}, Eval accuracy: {}'.format(eval_loss, eval_acc))
+
+# Compare both pipelines on synthetic lines with the line lengths of the three translations
+lengths = ragged_text.line_lengths([os.path.join(parent_dir, name) for name in FILE_NAMES])
+synthetic_lines = ragged_text.synthetic_lines(lengths, 50000, vocab_size)
+ragged_text.benchmark(synthetic_lines, vocab_size, BATCH_SIZE)
@@ -19,6 +19,14 @@ import tensorflow as tf
 
 import numpy as np
 import IPython.display as display
+import os
+import subprocess
+import sys
+import time
+
+import tfrecord_format
+import tfrecord_io
+import tfrecord_shards
 
 """## `tf.Example`
 
@@ -302,6 +310,68 @@ for parsed_record in parsed_dataset.take(10):
 
 """Here, the `tf.parse_example` function unpacks the `tf.Example` fields into standard tensors.
 
+### Parsing whole batches
+
+`_parse_function` runs one parsing op per record. `tfrecord_io.batched_tfrecord_dataset` batches the serialized records first and parses every batch with a single `tf.io.parse_example` call, and its `postprocess` function also runs once per batch:
+"""
+
+BENCHMARK_BATCH_SIZE = 256
+
+
+def _postprocess(features):
+  features['feature0'] = tf.cast(features['feature0'], tf.bool)
+  return features
+
+
+per_record_dataset = tf.data.TFRecordDataset(filenames).map(
+  _parse_function, num_parallel_calls=tf.data.experimental.AUTOTUNE).batch(BENCHMARK_BATCH_SIZE)
+batched_dataset = tfrecord_io.batched_tfrecord_dataset(filenames, feature_description,
+                                                      BENCHMARK_BATCH_SIZE, postprocess=_postprocess)
+
+for name, dataset in [('parse_single_example', per_record_dataset),
+                      ('parse_example', batched_dataset)]:
+  print('{}: {:.0f} records/sec'.format(name, tfrecord_io.records_per_second(dataset)))
+
+"""### Random access through an index
+
+A TFRecord file can only be read sequentially, so `skip(n)` reads and discards `n` records, `shuffle` only mixes the records within its buffer, and `shard` makes every worker read every record. `tfrecord_format.write_index` writes the offset and length of every record to a `.index.npy` sidecar next to the file (`write_tfrecord` writes it along with the file, and `IndexedTFRecords` builds it on first use). With the index, any record can be read directly:
+"""
+
+indexed_records = tfrecord_io.IndexedTFRecords(filenames)
+print(len(indexed_records), 'records')
+print(tf.io.parse_single_example(indexed_records[n_observations - 1], feature_description))
+
+"""`IndexedTFRecords.dataset` shuffles all the record ids of every epoch instead of using a shuffle buffer, skips records without reading them, and splits the records between workers into contiguous shards with the same number of bytes:"""
+
+NUM_WORKERS = 4
+
+for worker in range(NUM_WORKERS):
+  worker_dataset = indexed_records.dataset(shuffle=True, num_shards=NUM_WORKERS, shard_index=worker)
+  worker_batches = tfrecord_io.parse_batches(worker_dataset, feature_description, BENCHMARK_BATCH_SIZE)
+  print('worker {}: {} records, {:.0f} records/sec'.format(
+    worker, len(indexed_records.shard(NUM_WORKERS, worker)), tfrecord_io.records_per_second(worker_batches)))
+
+for parsed_record in indexed_records.dataset(skip=n_observations - 2).map(_parse_function):
+  print(repr(parsed_record))
+
+"""### Sharded files
+
+Large datasets are better stored in several files that can be written and read in parallel. `tfrecord_shards.py` splits the observations into shards of about `target_shard_mb` megabytes and writes them from a pool of worker processes. The workers are spawned and re-import the main module, so the script runs in a separate process, with the columns saved to an `.npz` file. `tfrecord_io.manifest_dataset` then interleaves the shards listed in the manifest:
+"""
+
+os.makedirs('observation_shards', exist_ok=True)
+np.savez('observation_shards/test.npz', feature0=feature0, feature1=feature1,
+         feature2=feature2, feature3=feature3)
+subprocess.run([sys.executable, tfrecord_shards.__file__, '--columns', 'observation_shards/test.npz',
+                '--output_prefix', 'observation_shards/test', '--target_shard_mb', '0.1'], check=True)
+manifest = tfrecord_shards.read_manifest('observation_shards/test.manifest.json')
+print(len(manifest['shards']), 'shards,', manifest['num_records'], 'records')
+
+sharded_dataset = tfrecord_io.manifest_dataset('observation_shards/test.manifest.json')
+sharded_batches = tfrecord_io.parse_batches(sharded_dataset, feature_description, BENCHMARK_BATCH_SIZE)
+print('manifest_dataset: {:.0f} records/sec'.format(tfrecord_io.records_per_second(sharded_batches)))
+
+"""
 ## TFRecord files in python
 
 The `tf.io` module also contains pure-Python functions for reading and writing TFRecord files.
@@ -331,6 +401,49 @@ for raw_record in raw_dataset.take(1):
   example.ParseFromString(raw_record.numpy())
   print(example)
 
+"""### Reading without TensorFlow
+
+Tools that only inspect or validate TFRecord files don't need to import TensorFlow. `tfrecord_format.TFRecordFile` memory-maps a file and walks the length/CRC framing described above, yielding every record as a zero-copy `memoryview` (`verify_crc=True` also checks the checksums), and `read_examples` decodes the fixed-length features of every record into NumPy arrays:
+"""
+
+with tfrecord_format.TFRecordFile(filename, verify_crc=True) as records:
+  print(sum(1 for _ in records), 'records')
+
+observations = tfrecord_format.read_examples(filename, {'feature0': (), 'feature1': (),
+                                                        'feature2': (), 'feature3': ()})
+print(observations['feature1'][:10], observations['feature2'][:10])
+
+"""### Writing whole columns at once
+
+Both writers above build the protobuf objects of one observation at a time in Python, so writing is dominated by interpreter overhead. `tfrecord_format.write_tfrecord` takes the NumPy columns themselves and writes the wire format of all the `tf.Example` messages of a chunk of rows with a few vectorized operations, then frames them through one large write buffer. The records parse to the same Examples as the ones `serialize_example` produces, although the bytes can differ, e.g. in the order of the features.
+"""
+
+
+def records_per_second(write, num_records):
+  start = time.time()
+  write()
+  return num_records / (time.time() - start)
+
+
+def write_with_tf_serialize_example():
+  dataset = tf.data.Dataset.from_tensor_slices((feature0, feature1, feature2, feature3))
+  writer = tf.data.experimental.TFRecordWriter('test_tf_serialize_example.tfrecord')
+  writer.write(dataset.map(tf_serialize_example))
+
+
+def write_columns():
+  tfrecord_format.write_tfrecord('test_columns.tfrecord',
+                                 {'feature0': feature0, 'feature1': feature1,
+                                  'feature2': feature2, 'feature3': feature3})
+
+
+for name, write in [('tf_serialize_example', write_with_tf_serialize_example),
+                    ('write_tfrecord', write_columns)]:
+  print('{}: {:.0f} records/sec'.format(name, records_per_second(write, n_observations)))
+
+for raw_record in tf.data.TFRecordDataset('test_columns.tfrecord').take(1):
+  print(tf.io.parse_single_example(raw_record, feature_description))
+
 """## Walkthrough: Reading/Writing Image Data
 
 This is an example of how to read and write image data using TFRecords. The purpose of this is to show how, end to end, input data (in this case an image) and write the data as a TFRecord file, then read the file back and display the image.
@@ -429,3 +542,11 @@ parsed_image_dataset = raw_image_dataset.map(_parse_image_function)
 for image_features in parsed_image_dataset:
   image_raw = image_features['image_raw'].numpy()
   display.display(display.Image(data=image_raw))
+
+"""The image records can be parsed in batches too, only the JPEG decoding is left per image:"""
+
+for image_batch in tfrecord_io.batched_tfrecord_dataset('images.tfrecords', image_feature_description,
+                                                        batch_size=2):
+  print(image_batch['label'].numpy(), image_batch['height'].numpy(), image_batch['width'].numpy())
+  for image_raw in image_batch['image_raw'].numpy():
+    display.display(display.Image(data=image_raw))
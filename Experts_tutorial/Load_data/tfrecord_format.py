@@ -0,0 +1,535 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""`tf.train.Example` wire format and TFRecord framing with NumPy only.
+
+This module does not import TensorFlow. `encode_examples` builds the
+serialized `tf.train.Example` of every row of a set of NumPy columns at once,
+without creating any protobuf object, by writing the protocol buffer wire
+format directly:
+
+  Example  { Features features = 1; }
+  Features { map<string, Feature> feature = 1; }
+  Feature  { BytesList bytes_list = 1; FloatList float_list = 2; Int64List int64_list = 3; }
+
+`write_tfrecord` frames the records as described in `tf_records.py`. Computing
+the CRC32C checksums needs the optional `crc32c` package, without it the
+records are written through `tf.io.TFRecordWriter` instead.
+
+TFRecord files can only be read sequentially. `build_index` finds the offset
+and length of every record by reading only the record headers, and
+`write_index` stores them in a `.index.npy` sidecar next to the file, which
+`tfrecord_io.IndexedTFRecords` uses for random access.
+
+`TFRecordFile` reads TFRecord files back without TensorFlow: it memory-maps a
+file and yields the records as zero-copy `memoryview`s, and `decode_example`
+and `read_examples` decode `tf.train.Example` messages into NumPy arrays.
+"""
+
+import numpy as np
+import mmap
+import os
+import struct
+
+try:
+  import crc32c as _crc32c
+except ImportError:
+  _crc32c = None
+
+# Feature field numbers
+_BYTES_LIST = 1
+_FLOAT_LIST = 2
+_INT64_LIST = 3
+
+
+def _tag(field, wire_type=2):
+  return bytes([(field << 3) | wire_type])
+
+
+def _varint(value):
+  out = bytearray()
+  while True:
+    byte = value & 0x7f
+    value >>= 7
+    if value:
+      out.append(byte | 0x80)
+    else:
+      out.append(byte)
+      return bytes(out)
+
+
+def _varints(values):
+  """Varint encodings of a uint64 array, as an (..., 10) byte matrix and the (...) lengths."""
+  values = np.asarray(values).astype(np.uint64)
+  shifts = np.arange(10, dtype=np.uint64) * np.uint64(7)
+  groups = (values[..., np.newaxis] >> shifts) & np.uint64(0x7f)
+
+  # the number of 7-bit groups up to the most significant non-zero one
+  nonzero = groups != 0
+  lengths = np.where(nonzero.any(axis=-1), 10 - np.argmax(nonzero[..., ::-1], axis=-1), 1)
+
+  continuation = np.arange(10) < (lengths[..., np.newaxis] - 1)
+  matrix = (groups | np.where(continuation, np.uint64(0x80), np.uint64(0))).astype(np.uint8)
+  return matrix, lengths
+
+
+class _Record(object):
+  """Per-row byte segments of a batch of records, concatenated in order."""
+
+  def __init__(self, num_rows):
+    self.num_rows = num_rows
+    self.segments = []
+
+  def lengths(self):
+    total = np.zeros(self.num_rows, dtype=np.int64)
+    for _, segment_lengths in self.segments:
+      total += segment_lengths
+    return total
+
+  def constant(self, data):
+    matrix = np.broadcast_to(np.frombuffer(data, dtype=np.uint8), (self.num_rows, len(data)))
+    self.segments.append((('matrix', matrix), np.full(self.num_rows, len(data), dtype=np.int64)))
+
+  def varint(self, values):
+    matrix, lengths = _varints(values)
+    self.segments.append((('matrix', matrix), lengths))
+
+  def matrix(self, matrix, lengths):
+    """Row `i` is the first `lengths[i]` bytes of `matrix[i]`."""
+    self.segments.append((('matrix', matrix), lengths))
+
+  def elements(self, matrix, lengths):
+    """Row `i` is the first `lengths[i, j]` bytes of every `matrix[i, j]`, in order."""
+    self.segments.append((('elements', (matrix, lengths)), lengths.sum(axis=1)))
+
+  def ragged(self, values):
+    lengths = np.array([len(value) for value in values], dtype=np.int64)
+    data = np.frombuffer(b''.join(values), dtype=np.uint8)
+    self.segments.append((('ragged', data), lengths))
+
+  def to_bytes(self):
+    """Write every row into one buffer, returns (buffer, row offsets)."""
+    lengths = self.lengths()
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    buffer = np.zeros(offsets[-1], dtype=np.uint8)
+
+    starts = offsets[:-1].copy()
+    for (kind, data), segment_lengths in self.segments:
+      if kind == 'matrix':
+        rows, cols = np.nonzero(np.arange(data.shape[-1]) < segment_lengths[:, np.newaxis])
+        buffer[starts[rows] + cols] = data[rows, cols]
+      elif kind == 'elements':
+        matrix, element_lengths = data
+        element_starts = np.cumsum(element_lengths, axis=1) - element_lengths
+        rows, elements, cols = np.nonzero(np.arange(matrix.shape[-1]) < element_lengths[..., np.newaxis])
+        buffer[starts[rows] + element_starts[rows, elements] + cols] = matrix[rows, elements, cols]
+      else:
+        row_starts = np.repeat(starts, segment_lengths)
+        within = np.arange(len(data)) - np.repeat(np.cumsum(segment_lengths) - segment_lengths,
+                                                  segment_lengths)
+        buffer[row_starts + within] = data
+      starts += segment_lengths
+
+    return buffer, offsets
+
+
+def _feature_payload(column):
+  """(Feature field, payload data, per-row payload lengths) of a column."""
+  column = np.asarray(column)
+  if column.dtype.kind in 'SUO':
+    values = [value if isinstance(value, bytes) else str(value).encode('utf-8') for value in column]
+    lengths = np.array([len(value) for value in values], dtype=np.int64)
+    return _BYTES_LIST, values, lengths
+
+  values = column.reshape(len(column), -1)
+  if column.dtype.kind == 'f':
+    data = values.astype('<f4').view(np.uint8).reshape(len(column), -1)
+    return _FLOAT_LIST, data, np.full(len(column), data.shape[1], dtype=np.int64)
+  if column.dtype.kind in 'biu':
+    # negative int64 values are encoded as their 64-bit two's complement
+    matrix, lengths = _varints(values.astype(np.int64).view(np.uint64))
+    return _INT64_LIST, (matrix, lengths), lengths.sum(axis=1)
+  raise ValueError('Unsupported column dtype: {}'.format(column.dtype))
+
+
+def encode_examples(columns):
+  """Serialize one `tf.train.Example` per row of `columns`.
+
+  Args:
+    columns: dict from feature name to a NumPy column. 1-D or 2-D numeric
+             columns become fixed-length int64 or float features (bools and
+             integers are int64, floats are stored as float32), 1-D bytes or
+             string columns become bytes features.
+
+  Returns:
+    (buffer, offsets): record `i` is `buffer[offsets[i]:offsets[i + 1]]`.
+  """
+  names = sorted(columns)
+  num_rows = len(columns[names[0]])
+
+  payloads = {name: _feature_payload(columns[name]) for name in names}
+
+  # lengths of the nested messages, from the innermost to the outermost one
+  list_lengths = {}
+  feature_lengths = {}
+  entry_lengths = {}
+  for name in names:
+    _, _, payload_lengths = payloads[name]
+    # a single bytes value or the packed numeric values: tag, length, payload
+    list_lengths[name] = 1 + _varints(payload_lengths)[1] + payload_lengths
+    feature_lengths[name] = 1 + _varints(list_lengths[name])[1] + list_lengths[name]
+    key = name.encode('utf-8')
+    entry_lengths[name] = (1 + len(_varint(len(key))) + len(key) +
+                           1 + _varints(feature_lengths[name])[1] + feature_lengths[name])
+
+  features_length = np.zeros(num_rows, dtype=np.int64)
+  for name in names:
+    features_length += 1 + _varints(entry_lengths[name])[1] + entry_lengths[name]
+
+  record = _Record(num_rows)
+  record.constant(_tag(1))              # Example.features
+  record.varint(features_length)
+  for name in names:
+    field, data, payload_lengths = payloads[name]
+    key = name.encode('utf-8')
+
+    record.constant(_tag(1))            # Features.feature map entry
+    record.varint(entry_lengths[name])
+    record.constant(_tag(1) + _varint(len(key)) + key + _tag(2))  # key, then value
+    record.varint(feature_lengths[name])
+    record.constant(_tag(field))        # Feature.kind
+    record.varint(list_lengths[name])
+    record.constant(_tag(1))            # the value field of the list
+    record.varint(payload_lengths)
+
+    if field == _BYTES_LIST:
+      record.ragged(data)
+    elif field == _FLOAT_LIST:
+      record.matrix(data, payload_lengths)
+    else:
+      record.elements(*data)
+
+  return record.to_bytes()
+
+
+def masked_crc(data):
+  """Masked CRC32C of `data`, as stored in TFRecord files."""
+  crc = _crc32c.crc32c(data) if _crc32c is not None else crc32c(data)
+  return (((crc >> 15) | (crc << 17)) + 0xa282ead8) & 0xffffffff
+
+
+_CRC32C_TABLE = None
+
+
+def crc32c(data):
+  """Pure-Python CRC32C (Castagnoli), slow, only used without the `crc32c` package."""
+  global _CRC32C_TABLE
+  if _CRC32C_TABLE is None:
+    _CRC32C_TABLE = []
+    for i in range(256):
+      crc = i
+      for _ in range(8):
+        crc = (crc >> 1) ^ 0x82f63b78 if crc & 1 else crc >> 1
+      _CRC32C_TABLE.append(crc)
+
+  crc = 0xffffffff
+  for byte in bytes(data):
+    crc = _CRC32C_TABLE[(crc ^ byte) & 0xff] ^ (crc >> 8)
+  return crc ^ 0xffffffff
+
+
+def frame_record(data):
+  """A single TFRecord: length, masked CRC of the length, data, masked CRC of the data."""
+  length = struct.pack('<Q', len(data))
+  return length + struct.pack('<I', masked_crc(length)) + bytes(data) + struct.pack('<I', masked_crc(data))
+
+
+def index_path(path):
+  """Path of the index sidecar of a TFRecord file."""
+  return path + '.index.npy'
+
+
+def build_index(path):
+  """(data offset, data length) of every record of a TFRecord file, as an (n, 2) int64 array.
+
+  Only the 12 byte header of every record is read, the data is skipped.
+  """
+  index = []
+  with open(path, 'rb') as f:
+    offset = 0
+    while True:
+      header = f.read(12)
+      if not header:
+        break
+      if len(header) < 12:
+        raise ValueError('Truncated record header at byte {} of {}'.format(offset, path))
+      length, = struct.unpack('<Q', header[:8])
+      index.append((offset + 12, length))
+      offset += 12 + length + 4
+      f.seek(offset)
+  return np.array(index, dtype=np.int64).reshape(-1, 2)
+
+
+def write_index(path, index=None):
+  """Write the index sidecar of a TFRecord file, built with `build_index` if not given."""
+  if index is None:
+    index = build_index(path)
+  np.save(index_path(path), index)
+  return index
+
+
+def _index_matches(path, index):
+  """Whether an index sidecar still describes the file: it ends where the file ends and is newer."""
+  size = os.path.getsize(path)
+  end = index[-1, 0] + index[-1, 1] + 4 if len(index) else 0
+  return end == size and os.path.getmtime(index_path(path)) >= os.path.getmtime(path)
+
+
+def load_index(path):
+  """The index of a TFRecord file, from its sidecar if it matches the file, else built and saved."""
+  try:
+    index = np.load(index_path(path))
+  except FileNotFoundError:
+    return write_index(path)
+  if not _index_matches(path, index):
+    return write_index(path)
+  return index
+
+
+def write_tfrecord(path, columns, rows_per_chunk=8192, buffer_size=16 << 20, index=True,
+                   use_tensorflow=None):
+  """Write one `tf.train.Example` per row of `columns` to a TFRecord file.
+
+  The rows are encoded `rows_per_chunk` at a time with `encode_examples`.
+
+  Args:
+    path: output TFRecord file.
+    columns: dict from feature name to a NumPy column, see `encode_examples`.
+    rows_per_chunk: rows encoded together.
+    buffer_size: size of the write buffer, in bytes.
+    index: also write the index sidecar of the file, see `build_index`.
+    use_tensorflow: frame the records with `tf.io.TFRecordWriter`. By default
+                    only if the `crc32c` package is missing, `False` uses the
+                    slow pure-Python `crc32c` instead.
+
+  Returns:
+    the number of records written.
+  """
+  num_rows = len(next(iter(columns.values())))
+  lengths = []
+
+  if use_tensorflow is None:
+    # Without a fast CRC32C, let TensorFlow frame the records
+    use_tensorflow = _crc32c is None
+
+  if use_tensorflow:
+    import tensorflow as tf
+    with tf.io.TFRecordWriter(path) as writer:
+      for start in range(0, num_rows, rows_per_chunk):
+        buffer, offsets = encode_examples({name: column[start:start + rows_per_chunk]
+                                           for name, column in columns.items()})
+        lengths.append(np.diff(offsets))
+        buffer = buffer.tobytes()
+        for i in range(len(offsets) - 1):
+          writer.write(buffer[offsets[i]:offsets[i + 1]])
+  else:
+    with open(path, 'wb', buffering=buffer_size) as f:
+      for start in range(0, num_rows, rows_per_chunk):
+        buffer, offsets = encode_examples({name: column[start:start + rows_per_chunk]
+                                           for name, column in columns.items()})
+        lengths.append(np.diff(offsets))
+        view = memoryview(buffer)
+        f.write(b''.join(frame_record(view[offsets[i]:offsets[i + 1]])
+                         for i in range(len(offsets) - 1)))
+
+  if index:
+    # every record is framed by a 12 byte header and a 4 byte footer
+    lengths = np.concatenate(lengths).astype(np.int64) if lengths else np.zeros(0, dtype=np.int64)
+    data_offsets = np.cumsum(lengths + 16) - lengths - 4
+    write_index(path, np.stack([data_offsets, lengths], axis=1))
+  return num_rows
+
+
+class TFRecordFile(object):
+  """Memory-mapped TFRecord file, iterating over it yields the records.
+
+  The records are `memoryview`s into the mapped file, they are only valid until
+  the file is closed.
+
+  Args:
+    path: TFRecord file.
+    verify_crc: check the CRC32C of the length and of the data of every record.
+  """
+
+  def __init__(self, path, verify_crc=False):
+    self.path = path
+    self.verify_crc = verify_crc
+    with open(path, 'rb') as f:
+      size = f.seek(0, 2)
+      # an empty file cannot be mapped
+      self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+    self._view = memoryview(self._map) if self._map is not None else memoryview(b'')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    self._view.release()
+    if self._map is not None:
+      try:
+        self._map.close()
+      except BufferError:
+        # records are still referenced, the mapping is closed once they are freed
+        pass
+
+  def __iter__(self):
+    view = self._view
+    offset = 0
+    while offset < len(view):
+      if offset + 12 > len(view):
+        raise ValueError('Truncated record header at byte {} of {}'.format(offset, self.path))
+      length, length_crc = struct.unpack_from('<QI', view, offset)
+      start = offset + 12
+      end = start + length
+      if end + 4 > len(view):
+        raise ValueError('Truncated record at byte {} of {}'.format(offset, self.path))
+      data = view[start:end]
+      if self.verify_crc:
+        data_crc, = struct.unpack_from('<I', view, end)
+        if masked_crc(view[offset:offset + 8]) != length_crc or masked_crc(data) != data_crc:
+          raise ValueError('Corrupted record at byte {} of {}'.format(offset, self.path))
+      yield data
+      offset = end + 4
+
+
+def _read_varint(data, pos):
+  result = 0
+  shift = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    result |= (byte & 0x7f) << shift
+    if not byte & 0x80:
+      return result, pos
+    shift += 7
+
+
+def _fields(data):
+  """(field number, wire type, value) of the fields of a serialized message.
+
+  The value is an int for varint fields and a `memoryview` for the others.
+  """
+  pos = 0
+  while pos < len(data):
+    key, pos = _read_varint(data, pos)
+    field, wire_type = key >> 3, key & 7
+    if wire_type == 0:
+      value, pos = _read_varint(data, pos)
+    elif wire_type == 1:
+      value, pos = data[pos:pos + 8], pos + 8
+    elif wire_type == 2:
+      length, pos = _read_varint(data, pos)
+      value, pos = data[pos:pos + length], pos + length
+    elif wire_type == 5:
+      value, pos = data[pos:pos + 4], pos + 4
+    else:
+      raise ValueError('Unsupported wire type {}'.format(wire_type))
+    yield field, wire_type, value
+
+
+def _decode_list(kind, data):
+  """The values of a BytesList, FloatList or Int64List, packed or not."""
+  if kind == _BYTES_LIST:
+    return [value.tobytes() for _, _, value in _fields(data)]
+
+  values = []
+  for _, wire_type, value in _fields(data):
+    if kind == _FLOAT_LIST:
+      values.append(np.frombuffer(value, dtype='<f4').copy())
+    elif wire_type == 0:
+      values.append(np.array([value], dtype=np.uint64))
+    else:
+      packed = []
+      pos = 0
+      while pos < len(value):
+        number, pos = _read_varint(value, pos)
+        packed.append(number)
+      values.append(np.array(packed, dtype=np.uint64))
+
+  if kind == _FLOAT_LIST:
+    return np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+  return (np.concatenate(values) if values else np.zeros(0, dtype=np.uint64)).view(np.int64)
+
+
+def decode_example(data):
+  """Decode a serialized `tf.train.Example` into a dict of feature values.
+
+  Int64 and float features become int64 and float32 NumPy arrays, bytes
+  features become lists of bytes.
+  """
+  features = {}
+  for field, _, example_features in _fields(data):
+    if field != 1:
+      continue
+    for entry_field, _, entry in _fields(example_features):
+      if entry_field != 1:
+        continue
+      name, feature = None, None
+      for key_field, _, value in _fields(entry):
+        if key_field == 1:
+          name = value.tobytes().decode('utf-8')
+        elif key_field == 2:
+          feature = value
+      values = None
+      for kind, _, value in _fields(feature if feature is not None else b''):
+        values = _decode_list(kind, value)
+      features[name] = values
+  return features
+
+
+def read_examples(path, features, verify_crc=False):
+  """Read fixed-length features of all the `tf.train.Example` records of a file.
+
+  Args:
+    path: TFRecord file.
+    features: dict from feature name to its shape, `()` for scalars.
+    verify_crc: see `TFRecordFile`.
+
+  Returns:
+    a dict from feature name to an array of shape `[num_records] + shape`,
+    int64, float32 or object (bytes) like the feature.
+  """
+  columns = {name: [] for name in features}
+  with TFRecordFile(path, verify_crc=verify_crc) as records:
+    for record in records:
+      example = decode_example(record)
+      for name in features:
+        if name not in example:
+          raise ValueError('Feature {} missing from a record of {}'.format(name, path))
+        columns[name].append(example[name])
+
+  arrays = {}
+  for name, shape in features.items():
+    values = columns[name]
+    if values and isinstance(values[0], list):
+      array = np.empty((len(values), int(np.prod(shape, dtype=np.int64))), dtype=object)
+      for i, value in enumerate(values):
+        array[i, :] = value
+    else:
+      array = np.stack(values) if values else np.zeros((0,), dtype=np.float32)
+    arrays[name] = array.reshape((len(values),) + tuple(shape))
+  return arrays
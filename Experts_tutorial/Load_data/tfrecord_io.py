@@ -0,0 +1,200 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""`tf.data` readers for TFRecord files of `tf.train.Example` messages.
+
+`tf.io.parse_single_example` mapped over a `TFRecordDataset` runs one parsing
+op per record. The readers here batch the serialized records first and parse
+every batch with a single `tf.io.parse_example` call, so any post-processing
+also runs once per batch on whole tensors.
+
+`IndexedTFRecords` reads records through the index sidecars of
+`tfrecord_format`, for random access, exact skipping, uniform shuffling of all
+the records and byte-balanced sharding, and `manifest_dataset` reads the
+shards written by `tfrecord_shards.write_shards` in parallel.
+"""
+
+import tensorflow as tf
+
+import numpy as np
+import time
+
+import tfrecord_format
+import tfrecord_shards
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def parse_batches(dataset, feature_description, batch_size, postprocess=None,
+                  drop_remainder=False):
+  """Batch a dataset of serialized `tf.train.Example` messages, then parse every batch.
+
+  Args:
+    dataset: `tf.data.Dataset` of serialized `tf.train.Example` string scalars.
+    feature_description: dict of `tf.io.FixedLenFeature`, `VarLenFeature`, ...
+    batch_size: number of records parsed together.
+    postprocess: optional function applied to the dict of parsed batch tensors.
+    drop_remainder: drop the last batch if it is smaller than `batch_size`.
+
+  Returns:
+    a `tf.data.Dataset` of parsed batches.
+  """
+
+  def parse(serialized):
+    features = tf.io.parse_example(serialized, feature_description)
+    if postprocess is not None:
+      features = postprocess(features)
+    return features
+
+  dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+  return dataset.map(parse, num_parallel_calls=AUTOTUNE)
+
+
+def batched_tfrecord_dataset(filenames, feature_description, batch_size, postprocess=None,
+                             shuffle_buffer_size=0, drop_remainder=False):
+  """Parsed batches of the `tf.train.Example` records of TFRecord files.
+
+  Args:
+    filenames: TFRecord file or list of files, read in parallel.
+    feature_description: see `parse_batches`.
+    batch_size: see `parse_batches`.
+    postprocess: see `parse_batches`.
+    shuffle_buffer_size: shuffle the serialized records first, if not 0.
+    drop_remainder: see `parse_batches`.
+
+  Returns:
+    a `tf.data.Dataset` of parsed batches.
+  """
+  dataset = tf.data.TFRecordDataset(filenames, num_parallel_reads=AUTOTUNE)
+  if shuffle_buffer_size:
+    dataset = dataset.shuffle(shuffle_buffer_size)
+  dataset = parse_batches(dataset, feature_description, batch_size,
+                          postprocess=postprocess, drop_remainder=drop_remainder)
+  return dataset.prefetch(AUTOTUNE)
+
+
+def records_per_second(dataset):
+  """Iterate over a dataset of parsed batches and return the records/sec."""
+  num_records = 0
+  start = time.time()
+  for batch in dataset:
+    num_records += int(tf.shape(tf.nest.flatten(batch)[0])[0])
+  return num_records / (time.time() - start)
+
+
+def manifest_dataset(manifest_path, cycle_length=None, shuffle_shards=False, num_workers=1,
+                     worker_index=0, seed=None):
+  """Serialized records of the shards listed in a `tfrecord_shards` manifest.
+
+  Args:
+    manifest_path: the `<prefix>.manifest.json` file of `write_shards`.
+    cycle_length: number of shards read at the same time, defaults to the number of CPUs.
+    shuffle_shards: read the shards in a random order.
+    num_workers: number of workers the shards are split between.
+    worker_index: index of this worker.
+    seed: random seed of the shard order.
+
+  Returns:
+    a `tf.data.Dataset` of string scalars.
+  """
+  manifest = tfrecord_shards.read_manifest(manifest_path)
+  paths = tf.data.Dataset.from_tensor_slices([shard['path'] for shard in manifest['shards']])
+  paths = paths.shard(num_workers, worker_index)
+  if shuffle_shards:
+    paths = paths.shuffle(len(manifest['shards']), seed=seed)
+  return paths.interleave(tf.data.TFRecordDataset,
+                          cycle_length=cycle_length,
+                          num_parallel_calls=AUTOTUNE)
+
+
+class IndexedTFRecords(object):
+  """Random access to the records of TFRecord files through their index sidecars.
+
+  The files are memory-mapped and a record is read from its offset, without
+  scanning the records before it. Records are numbered in file order.
+  """
+
+  def __init__(self, filenames):
+    if isinstance(filenames, str):
+      filenames = [filenames]
+    self.filenames = list(filenames)
+
+    indices = [tfrecord_format.load_index(filename) for filename in self.filenames]
+    self.file_ids = np.concatenate([np.full(len(index), i, dtype=np.int64)
+                                    for i, index in enumerate(indices)])
+    self.offsets = np.concatenate([index[:, 0] for index in indices])
+    self.lengths = np.concatenate([index[:, 1] for index in indices])
+    self._files = {}
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def _file(self, file_id):
+    if file_id not in self._files:
+      self._files[file_id] = np.memmap(self.filenames[file_id], dtype=np.uint8, mode='r')
+    return self._files[file_id]
+
+  def __getitem__(self, record_id):
+    offset = self.offsets[record_id]
+    return self._file(self.file_ids[record_id])[offset:offset + self.lengths[record_id]].tobytes()
+
+  def read(self, record_ids):
+    """The records of `record_ids`, as a NumPy array of bytes objects."""
+    return np.array([self[record_id] for record_id in record_ids], dtype=object)
+
+  def shard(self, num_shards, shard_index):
+    """Record ids of a contiguous shard, with about `1 / num_shards` of the bytes."""
+    if not len(self):
+      return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(self.lengths + 16)
+    bounds = np.searchsorted(ends, ends[-1] * np.arange(num_shards + 1) / num_shards, side='right')
+    bounds[0], bounds[-1] = 0, len(self)
+    return np.arange(bounds[shard_index], bounds[shard_index + 1], dtype=np.int64)
+
+  def dataset(self, shuffle=False, num_shards=1, shard_index=0, skip=0, num_epochs=1,
+              read_batch_size=256, seed=None):
+    """`tf.data.Dataset` of the serialized records, like `TFRecordDataset`.
+
+    Args:
+      shuffle: read the records of every epoch in a uniformly random order.
+      num_shards: number of workers the records are split between.
+      shard_index: shard of this worker, see `shard`.
+      skip: number of records of the shard to skip, without reading them.
+      num_epochs: number of passes over the shard, `None` repeats forever.
+      read_batch_size: number of records read by one call into Python.
+      seed: random seed of the shuffling.
+
+    Returns:
+      a `tf.data.Dataset` of string scalars.
+    """
+    record_ids = self.shard(num_shards, shard_index)[skip:]
+
+    def read_records(ids):
+      # read the mapped pages in file order, then put the records back in the order of `ids`
+      order = np.argsort(ids)
+      records = np.empty(len(ids), dtype=object)
+      records[order] = self.read(ids[order])
+      return records
+
+    def epoch(_):
+      ids = tf.constant(record_ids)
+      if shuffle:
+        ids = tf.random.shuffle(ids, seed=seed)
+      return tf.data.Dataset.from_tensor_slices(ids).batch(read_batch_size)
+
+    epochs = tf.data.Dataset.range(num_epochs) if num_epochs is not None else tf.data.Dataset.range(1).repeat()
+    dataset = epochs.flat_map(epoch)
+    dataset = dataset.map(lambda ids: tf.ensure_shape(tf.numpy_function(read_records, [ids], tf.string), [None]),
+                          num_parallel_calls=AUTOTUNE)
+    return dataset.unbatch()
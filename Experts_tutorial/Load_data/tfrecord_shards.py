@@ -0,0 +1,163 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Write a dataset to TFRecord shards with a pool of worker processes.
+
+`write_shards` splits a list of items into shards of about `target_shard_mb`
+megabytes, and worker processes encode and write the shards in parallel with
+`tfrecord_format.write_tfrecord`. A `<prefix>.manifest.json` file listing the
+shards is written last, once every shard is complete, and
+`tfrecord_io.manifest_dataset` reads the shards it lists.
+
+The workers are spawned, so they re-import the main module: call
+`write_shards` from a module or under `if __name__ == '__main__':`, never from
+the top level of a script. The tutorial scripts run this module instead:
+
+    python tfrecord_shards.py --image_list flowers.json --output_prefix image_shards/flowers
+    python tfrecord_shards.py --columns observations.npz --output_prefix observation_shards/test
+
+The records are framed with the `crc32c` package if it is installed, and with
+`tf.io.TFRecordWriter` otherwise, see `tfrecord_format.write_tfrecord`.
+"""
+
+import numpy as np
+import argparse
+import json
+import math
+import multiprocessing
+import os
+
+import tfrecord_format
+
+# Records used to estimate the size of a shard when no item sizes are given
+_SIZE_SAMPLE = 64
+
+
+def read_image_files(items):
+  """Columns of (path, label) items: the raw file bytes as 'image_raw' and 'label'."""
+  image_raw = np.empty(len(items), dtype=object)
+  for i, (path, _) in enumerate(items):
+    with open(path, 'rb') as f:
+      image_raw[i] = f.read()
+  labels = np.array([label for _, label in items], dtype=np.int64)
+  return {'image_raw': image_raw, 'label': labels}
+
+
+def _num_items(items, encode):
+  return len(next(iter(items.values()))) if encode is None else len(items)
+
+
+def _slice(items, encode, start, end):
+  if encode is None:
+    return {name: column[start:end] for name, column in items.items()}
+  return items[start:end]
+
+
+def _record_sizes(items, encode):
+  """Estimated size of every framed record, from the encoded size of a sample."""
+  sample = _slice(items, encode, 0, _SIZE_SAMPLE)
+  columns = sample if encode is None else encode(sample)
+  _, offsets = tfrecord_format.encode_examples(columns)
+  num_sampled = _num_items(sample, encode)
+  return np.full(_num_items(items, encode), offsets[-1] / max(num_sampled, 1) + 16)
+
+
+def _write_shard(task):
+  encode, items, path = task
+  columns = items if encode is None else encode(items)
+  num_records = tfrecord_format.write_tfrecord(path, columns)
+  return path, num_records, os.path.getsize(path)
+
+
+def write_shards(items, encode, output_prefix, target_shard_mb=100, sizes=None, num_workers=None):
+  """Encode `items` into TFRecord shards in parallel and write their manifest.
+
+  Args:
+    items: list or array of items, each one becomes a record, or a dict of
+           NumPy columns if `encode` is `None`.
+    encode: function from a slice of `items` to a dict of NumPy columns, see
+            `tfrecord_format.encode_examples`. Must be importable from a
+            module other than the main script. `None` writes `items` as they are.
+    output_prefix: the shards are `<prefix>-00000-of-00012.tfrecord`, ...
+    target_shard_mb: approximate size of a shard, in megabytes.
+    sizes: optional size in bytes of every item, used to balance the shards.
+           Estimated by encoding a sample of the items if not given.
+    num_workers: number of worker processes, defaults to the number of CPUs.
+
+  Returns:
+    the manifest, also written to `<prefix>.manifest.json`.
+  """
+  num_items = _num_items(items, encode)
+  if not num_items:
+    raise ValueError('No items to write')
+  if sizes is None:
+    sizes = _record_sizes(items, encode)
+  ends = np.cumsum(sizes)
+  num_shards = max(int(math.ceil(ends[-1] / (target_shard_mb * 2 ** 20))), 1)
+  bounds = np.searchsorted(ends, ends[-1] * np.arange(num_shards + 1) / num_shards, side='right')
+  bounds[0], bounds[-1] = 0, num_items
+  # items larger than a shard leave some shards empty, drop them
+  bounds = np.unique(bounds)
+  num_shards = len(bounds) - 1
+
+  tasks = []
+  for shard in range(num_shards):
+    path = '{}-{:05d}-of-{:05d}.tfrecord'.format(output_prefix, shard, num_shards)
+    tasks.append((encode, _slice(items, encode, bounds[shard], bounds[shard + 1]), path))
+
+  # spawn, so no worker inherits the TensorFlow runtime of the parent
+  context = multiprocessing.get_context('spawn')
+  with context.Pool(num_workers or os.cpu_count()) as pool:
+    shards = pool.map(_write_shard, tasks, chunksize=1)
+
+  manifest = {'num_records': int(sum(num_records for _, num_records, _ in shards)),
+              'shards': [{'path': os.path.basename(path), 'num_records': num_records, 'num_bytes': num_bytes}
+                         for path, num_records, num_bytes in shards]}
+  with open(output_prefix + '.manifest.json', 'w') as f:
+    json.dump(manifest, f, indent=2)
+  return manifest
+
+
+def read_manifest(manifest_path):
+  """The manifest written by `write_shards`, with the shard paths made absolute."""
+  with open(manifest_path, 'r') as f:
+    manifest = json.load(f)
+  directory = os.path.dirname(os.path.abspath(manifest_path))
+  for shard in manifest['shards']:
+    shard['path'] = os.path.join(directory, shard['path'])
+  return manifest
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument('--image_list', help='JSON list of [image path, label] pairs')
+  source.add_argument('--columns', help='.npz file of NumPy columns')
+  parser.add_argument('--output_prefix', required=True)
+  parser.add_argument('--target_shard_mb', type=float, default=100)
+  parser.add_argument('--num_workers', type=int, default=None)
+  args = parser.parse_args()
+
+  if args.image_list:
+    with open(args.image_list, 'r') as f:
+      image_items = [(path, label) for path, label in json.load(f)]
+    manifest = write_shards(image_items, read_image_files, args.output_prefix, args.target_shard_mb,
+                            sizes=[os.path.getsize(path) for path, _ in image_items],
+                            num_workers=args.num_workers)
+  else:
+    with np.load(args.columns) as data:
+      columns = {name: data[name] for name in data.files}
+    manifest = write_shards(columns, None, args.output_prefix, args.target_shard_mb,
+                            num_workers=args.num_workers)
+  print('{} shards, {} records'.format(len(manifest['shards']), manifest['num_records']))
@@ -0,0 +1,90 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""In-graph vocabulary building and lookup for text lines.
+
+Both steps only use `tf.strings` and `tf.lookup` ops, so they run inside
+`tf.data` with `num_parallel_calls`, without `tf.py_function` and without the
+Python GIL.
+
+Id `0` is kept for padding, the words of the vocabulary file get ids `1` to
+`len(vocabulary)`, and out-of-vocabulary words are hashed into the
+`num_oov_buckets` ids that follow.
+"""
+
+import tensorflow as tf
+
+import collections
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def tokenize(lines):
+  """Split lines into words, like `tfds.features.text.Tokenizer` does."""
+  lines = tf.strings.regex_replace(lines, r'[^\p{L}\p{N}_]+', ' ')
+  return tf.strings.split(tf.strings.strip(lines))
+
+
+def build_vocabulary(lines, vocab_path, batch_size=1024, min_count=1):
+  """Count the words of a dataset of lines and write them to `vocab_path`.
+
+  Every batch of lines is tokenized and counted in parallel inside the
+  `tf.data` pipeline, only the per-batch counts are merged in Python.
+
+  Args:
+    lines: `tf.data.Dataset` of string scalars.
+    vocab_path: output file, one word per line, most frequent first.
+    batch_size: number of lines counted together.
+    min_count: words seen fewer times are left out of the vocabulary.
+
+  Returns:
+    the list of words, in the order of the file.
+  """
+
+  def count_words(batch):
+    words, _, counts = tf.unique_with_counts(tokenize(batch).flat_values)
+    return words, counts
+
+  batch_counts = lines.batch(batch_size).map(count_words, num_parallel_calls=AUTOTUNE)
+
+  counter = collections.Counter()
+  for words, counts in batch_counts.prefetch(AUTOTUNE):
+    counter.update(dict(zip(words.numpy(), counts.numpy())))
+
+  vocabulary = [word for word, count in counter.most_common() if count >= min_count]
+  with open(vocab_path, 'wb') as f:
+    for word in vocabulary:
+      f.write(word + b'\n')
+
+  return [word.decode('utf-8') for word in vocabulary]
+
+
+def lookup_table(vocab_path, num_oov_buckets=1):
+  """Static hash table from the words of `vocab_path` to their 0-based line numbers."""
+  initializer = tf.lookup.TextFileInitializer(vocab_path,
+                                              key_dtype=tf.string,
+                                              key_index=tf.lookup.TextFileIndex.WHOLE_LINE,
+                                              value_dtype=tf.int64,
+                                              value_index=tf.lookup.TextFileIndex.LINE_NUMBER)
+  return tf.lookup.StaticVocabularyTable(initializer, num_oov_buckets)
+
+
+def vocab_size(vocabulary, num_oov_buckets=1):
+  """Size of the embedding table for ids produced by `encode`."""
+  return len(vocabulary) + num_oov_buckets + 1
+
+
+def encode(table, line):
+  """Word ids of a line, shifted by one so that `0` stays free for padding."""
+  return table.lookup(tokenize(line)) + 1
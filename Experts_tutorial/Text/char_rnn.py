@@ -0,0 +1,332 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Reusable helpers for the character-based RNN in `text_generation.py`."""
+
+import tensorflow as tf
+
+import numpy as np
+import json
+import time
+
+
+def filter_logits(logits, temperature, top_k, top_p):
+  """Scale and truncate next-character logits, row by row.
+
+  Args:
+    logits: float tensor with shape == (batch_size, vocab_size).
+    temperature: float tensor with shape == (batch_size,).
+    top_k: int32 tensor with shape == (batch_size,). `0` keeps every character.
+    top_p: float tensor with shape == (batch_size,). `1.0` keeps every character.
+
+  Returns:
+    logits with the filtered out characters set to `-inf`.
+  """
+  vocab_size = tf.shape(logits)[-1]
+  logits = logits / tf.expand_dims(temperature, -1)
+  neg_inf = tf.fill(tf.shape(logits), float('-inf'))
+
+  # top-k: drop everything below the k-th largest logit of each row
+  sorted_logits = tf.sort(logits, direction='DESCENDING')
+  top_k = tf.where(top_k > 0, tf.minimum(top_k, vocab_size), vocab_size)
+  kth_logit = tf.gather(sorted_logits, top_k - 1, batch_dims=1)
+  logits = tf.where(logits < tf.expand_dims(kth_logit, -1), neg_inf, logits)
+
+  # nucleus: keep the smallest set of characters whose probability reaches top_p,
+  # the most likely character is always kept
+  sorted_logits = tf.sort(logits, direction='DESCENDING')
+  cumulative_probs = tf.cumsum(tf.nn.softmax(sorted_logits), axis=-1, exclusive=True)
+  num_kept = tf.reduce_sum(
+    tf.cast(cumulative_probs < tf.expand_dims(top_p, -1), tf.int32), axis=-1)
+  min_logit = tf.gather(sorted_logits, tf.maximum(num_kept, 1) - 1, batch_dims=1)
+  logits = tf.where(logits < tf.expand_dims(min_logit, -1), neg_inf, logits)
+
+  return logits
+
+
+def make_sampler(model):
+  """Compile a generation loop around a stateful model.
+
+  The returned function runs every step of the generation inside a single
+  `tf.function`, so the only host round trip is reading back the ids at the end.
+
+  Args:
+    model: model returned by `build_model`, its batch size is the number of
+           samples that are generated in parallel.
+
+  Returns:
+    sample(start_ids, num_generate, temperature, top_k, top_p) -> generated ids
+    with shape == (batch_size, num_generate).
+  """
+
+  @tf.function
+  def sample(start_ids, num_generate, temperature, top_k, top_p):
+    # prime the RNN state with the whole start string
+    logits = model(start_ids)[:, -1, :]
+
+    generated = tf.TensorArray(tf.int32, size=num_generate)
+    for i in tf.range(num_generate):
+      logits = filter_logits(logits, temperature, top_k, top_p)
+      predicted_id = tf.random.categorical(logits, num_samples=1, dtype=tf.int32)
+      generated = generated.write(i, tf.squeeze(predicted_id, -1))
+
+      # the predicted characters are the next input, together with the state
+      # kept by the stateful LSTM
+      logits = model(predicted_id)[:, -1, :]
+
+    return tf.transpose(generated.stack())
+
+  return sample
+
+
+def generate_samples(model, char2idx, idx2char, start_string, num_generate=1000,
+                     temperature=1.0, top_k=0, top_p=1.0, sampler=None):
+  """Generate `batch_size` independent texts from the same start string.
+
+  `temperature`, `top_k` and `top_p` are either scalars or one value per sample.
+
+  Args:
+    model: model returned by `build_model`, with the trained weights loaded.
+    char2idx: mapping from characters to indices.
+    idx2char: numpy array mapping indices to characters.
+    start_string: prefix of every sample.
+    num_generate: number of characters to generate per sample.
+    temperature: low temperatures give more predictable text.
+    top_k: only sample from the `top_k` most likely characters, `0` disables it.
+    top_p: only sample from the most likely characters whose probability adds
+           up to `top_p`, `1.0` disables it.
+    sampler: optional function returned by `make_sampler(model)`, pass it to
+             reuse the same trace between calls.
+
+  Returns:
+    list of generated strings, one per sample.
+  """
+  batch_size = model.input_shape[0]
+  if sampler is None:
+    sampler = make_sampler(model)
+
+  start_ids = [char2idx[s] for s in start_string]
+  start_ids = tf.tile(tf.constant([start_ids], dtype=tf.int32), [batch_size, 1])
+
+  def per_sample(value, dtype):
+    return tf.broadcast_to(tf.cast(value, dtype), [batch_size])
+
+  # the first call on a new sampler also includes the tracing time
+  model.reset_states()
+  start = time.time()
+  generated = sampler(start_ids,
+                      tf.constant(num_generate, dtype=tf.int32),
+                      per_sample(temperature, tf.float32),
+                      per_sample(top_k, tf.int32),
+                      per_sample(top_p, tf.float32)).numpy()
+  duration = time.time() - start
+
+  print('Generated {} samples x {} characters in {:.2f} sec ({:.0f} characters/sec)'.format(
+    batch_size, num_generate, duration, batch_size * num_generate / duration))
+
+  return [start_string + ''.join(idx2char[ids]) for ids in generated]
+
+
+class CharRNNStep(tf.Module):
+  """Stateless single step of the model returned by `build_model`.
+
+  The LSTM state is passed in and returned instead of being kept in the layer,
+  so one instance serves any number of independent sessions at any batch size.
+  """
+
+  def __init__(self, model, vocab):
+    super(CharRNNStep, self).__init__()
+    embedding, lstm, dense = model.layers
+
+    # copy the trained weights, the stateful model can then be dropped
+    self.embeddings = tf.Variable(embedding.embeddings)
+    self.kernel = tf.Variable(lstm.cell.kernel)
+    self.recurrent_kernel = tf.Variable(lstm.cell.recurrent_kernel)
+    self.bias = tf.Variable(lstm.cell.bias)
+    self.output_kernel = tf.Variable(dense.kernel)
+    self.output_bias = tf.Variable(dense.bias)
+
+    # exported with the weights so a server only needs the SavedModel
+    self.vocab = tf.Variable(list(vocab), trainable=False)
+
+  @tf.function(input_signature=[tf.TensorSpec([None], tf.int32),
+                                tf.TensorSpec([None, None], tf.float32),
+                                tf.TensorSpec([None, None], tf.float32)])
+  def __call__(self, ids, h, c):
+    """Run one character through the model.
+
+    Args:
+      ids: character indices with shape == (batch_size,).
+      h: LSTM hidden state with shape == (batch_size, units).
+      c: LSTM cell state with shape == (batch_size, units).
+
+    Returns:
+      logits with shape == (batch_size, vocab_size), and the new h and c.
+    """
+    x = tf.nn.embedding_lookup(self.embeddings, ids)
+
+    # same gates as `tf.keras.layers.LSTM`, in the (input, forget, cell, output) order
+    z = tf.matmul(x, self.kernel) + tf.matmul(h, self.recurrent_kernel) + self.bias
+    i, f, g, o = tf.split(z, 4, axis=1)
+    c = tf.sigmoid(f) * c + tf.sigmoid(i) * tf.tanh(g)
+    h = tf.sigmoid(o) * tf.tanh(c)
+
+    logits = tf.matmul(h, self.output_kernel) + self.output_bias
+    return logits, h, c
+
+
+def export_step(model, vocab, export_dir):
+  """Save the trained weights of `model` as a stateless `CharRNNStep` SavedModel."""
+  step = CharRNNStep(model, vocab)
+  tf.saved_model.save(step, export_dir)
+  return step
+
+
+def _read_chunks(path, chunk_size):
+  # newline='' keeps '\r' characters, like decoding the raw bytes does
+  with open(path, 'r', encoding='utf-8', newline='') as f:
+    while True:
+      chunk = f.read(chunk_size)
+      if not chunk:
+        return
+      yield chunk
+
+
+def _code_points(chunk):
+  return np.frombuffer(chunk.encode('utf-32-le'), dtype=np.uint32)
+
+
+def encode_corpus(text_path, corpus_path, chunk_size=1 << 24):
+  """Encode a text file once into a memory-mappable array of character indices.
+
+  The text is streamed twice in chunks of `chunk_size` characters, first to
+  find the vocabulary and the length, then to write the indices, so the corpus
+  never has to fit in memory. The vocabulary is written next to the array as
+  `<corpus_path>.vocab.json`.
+
+  Args:
+    text_path: utf-8 text file.
+    corpus_path: output `.npy` file, uint8 if the vocabulary has at most 256
+                 characters and uint16 otherwise.
+
+  Returns:
+    the vocabulary, sorted like `sorted(set(text))`.
+  """
+  code_points = np.zeros(0, dtype=np.uint32)
+  length = 0
+  for chunk in _read_chunks(text_path, chunk_size):
+    code_points = np.union1d(code_points, _code_points(chunk))
+    length += len(chunk)
+
+  if len(code_points) > np.iinfo(np.uint16).max + 1:
+    raise ValueError('{} has more than 65536 unique characters'.format(text_path))
+  dtype = np.uint8 if len(code_points) <= 256 else np.uint16
+
+  corpus = np.lib.format.open_memmap(corpus_path, mode='w+', dtype=dtype, shape=(length,))
+  offset = 0
+  for chunk in _read_chunks(text_path, chunk_size):
+    # code points are sorted, so a binary search gives the character indices
+    corpus[offset:offset + len(chunk)] = np.searchsorted(code_points, _code_points(chunk))
+    offset += len(chunk)
+  corpus.flush()
+
+  vocab = [chr(code_point) for code_point in code_points]
+  with open(corpus_path + '.vocab.json', 'w', encoding='utf-8') as f:
+    json.dump(vocab, f)
+
+  return vocab
+
+
+def load_corpus(corpus_path):
+  """Memory-map a corpus written by `encode_corpus`, returns (corpus, vocab)."""
+  with open(corpus_path + '.vocab.json', 'r', encoding='utf-8') as f:
+    vocab = json.load(f)
+  return np.load(corpus_path, mmap_mode='r'), vocab
+
+
+def random_window_dataset(corpus, seq_length, batch_size, steps_per_epoch=None):
+  """Batches of (input, target) windows starting at random offsets of `corpus`.
+
+  The offsets are drawn in the graph for every batch, so each epoch sees new
+  chunk boundaries, and only the sampled windows are read from the
+  memory-mapped corpus.
+
+  Args:
+    corpus: 1-D array of character indices, usually from `load_corpus`.
+    seq_length: number of characters in each input.
+    batch_size: number of windows per batch.
+    steps_per_epoch: batches per epoch, defaults to one pass worth of characters.
+
+  Returns:
+    a `tf.data.Dataset` of int32 (input, target) pairs with
+    shape == (batch_size, seq_length).
+  """
+  if len(corpus) <= seq_length:
+    raise ValueError('The corpus has {} characters, it needs more than seq_length = {}'.format(
+      len(corpus), seq_length))
+  if steps_per_epoch is None:
+    steps_per_epoch = len(corpus) // (seq_length * batch_size)
+  max_offset = len(corpus) - seq_length
+  window = np.arange(seq_length + 1)
+  dtype = tf.as_dtype(corpus.dtype)
+
+  def read_windows(offsets):
+    return corpus[offsets[:, np.newaxis] + window]
+
+  def sample_windows(_):
+    offsets = tf.random.uniform([batch_size], maxval=max_offset, dtype=tf.int64)
+    windows = tf.numpy_function(read_windows, [offsets], dtype)
+    windows = tf.cast(tf.reshape(windows, [batch_size, seq_length + 1]), tf.int32)
+    return windows[:, :-1], windows[:, 1:]
+
+  dataset = tf.data.Dataset.range(steps_per_epoch)
+  dataset = dataset.map(sample_windows, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def truncated_bptt_dataset(corpus, batch_size, unroll_length):
+  """Batches that continue each other, for truncated backpropagation through time.
+
+  The corpus is cut into `batch_size` contiguous streams, and batch `i` holds
+  chunk `i` of every stream, so row `j` of a batch directly follows row `j` of
+  the previous batch and the state kept by a stateful RNN is the true context.
+  Gradients only flow through `unroll_length` steps, which bounds the per-step
+  memory, while the state carries the context further.
+
+  Args:
+    corpus: 1-D array of character indices, in memory or from `load_corpus`.
+    batch_size: number of streams, must match the batch size of the model.
+    unroll_length: number of characters per chunk.
+
+  Returns:
+    a `tf.data.Dataset` of int32 (input, target) pairs with
+    shape == (batch_size, unroll_length), in order. Don't shuffle it.
+  """
+  stream_length = (len(corpus) - 1) // batch_size
+  num_chunks = stream_length // unroll_length
+  stream_starts = np.arange(batch_size) * stream_length
+  window = np.arange(unroll_length + 1)
+  dtype = tf.as_dtype(corpus.dtype)
+
+  def read_chunk(chunk):
+    return corpus[(stream_starts + chunk * unroll_length)[:, np.newaxis] + window]
+
+  def split_chunk(chunk):
+    windows = tf.numpy_function(read_chunk, [chunk], dtype)
+    windows = tf.cast(tf.reshape(windows, [batch_size, unroll_length + 1]), tf.int32)
+    return windows[:, :-1], windows[:, 1:]
+
+  dataset = tf.data.Dataset.range(num_chunks)
+  dataset = dataset.map(split_chunk, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
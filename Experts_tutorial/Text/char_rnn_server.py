@@ -0,0 +1,208 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Serve many char-RNN generation sessions from one stateless step function.
+
+Export the trained model with `char_rnn.export_step`, then run:
+
+    python char_rnn_server.py --export_dir ./char_rnn_step --port 8000
+
+Every session keeps its own LSTM state on the server. The steps of all the
+sessions that are generating at the same time are batched into one call of the
+step function.
+
+POST /generate
+  {"session": null, "prime": "ROMEO: ", "num_generate": 100, "temperature": 1.0}
+  -> {"session": "3f2a...", "text": "..."}
+
+  Pass the returned `session` back to continue the same text. A new session
+  needs a non-empty `prime`.
+
+POST /close
+  {"session": "3f2a..."} -> {}
+"""
+
+import tensorflow as tf
+
+import numpy as np
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StepBatcher(object):
+  """Collect single steps from many threads and run them as one batch."""
+
+  def __init__(self, step, max_batch_size=256, max_wait=0.002):
+    self.step_fn = step
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait
+    self._requests = queue.Queue()
+
+    worker = threading.Thread(target=self._run, daemon=True)
+    worker.start()
+
+  def step(self, char_id, h, c):
+    """Blocking single step for one session, returns (logits, h, c)."""
+    request = {'inputs': (char_id, h, c), 'done': threading.Event()}
+    self._requests.put(request)
+    request['done'].wait()
+
+    if 'error' in request:
+      raise request['error']
+    return request['outputs']
+
+  def _next_batch(self):
+    batch = [self._requests.get()]
+    deadline = time.time() + self.max_wait
+    while len(batch) < self.max_batch_size:
+      timeout = deadline - time.time()
+      if timeout <= 0:
+        break
+      try:
+        batch.append(self._requests.get(timeout=timeout))
+      except queue.Empty:
+        break
+    return batch
+
+  def _run(self):
+    while True:
+      batch = self._next_batch()
+      ids, h, c = zip(*[request['inputs'] for request in batch])
+      try:
+        logits, h, c = self.step_fn(tf.constant(ids, dtype=tf.int32),
+                                    tf.constant(np.stack(h)),
+                                    tf.constant(np.stack(c)))
+        logits, h, c = logits.numpy(), h.numpy(), c.numpy()
+        for i, request in enumerate(batch):
+          request['outputs'] = (logits[i], h[i], c[i])
+      except Exception as e:
+        for request in batch:
+          request['error'] = e
+      for request in batch:
+        request['done'].set()
+
+
+class GenerationSessions(object):
+  """Per-session LSTM state on top of a `StepBatcher`."""
+
+  def __init__(self, step, max_batch_size=256, max_wait=0.002):
+    self.batcher = StepBatcher(step, max_batch_size, max_wait)
+    self.units = step.recurrent_kernel.shape[0]
+    self.idx2char = np.array([char.decode('utf-8') for char in step.vocab.numpy()])
+    self.char2idx = {u: i for i, u in enumerate(self.idx2char)}
+    self._sessions = {}
+    self._lock = threading.Lock()
+
+  def generate(self, session_id, prime, num_generate, temperature=1.0):
+    # validate before taking the session, so a bad request does not lose it
+    unknown = sorted(set(prime) - set(self.char2idx))
+    if unknown:
+      raise ValueError('characters not in the vocabulary: {!r}'.format(''.join(unknown)))
+    if not temperature > 0:
+      raise ValueError('temperature must be positive, got {}'.format(temperature))
+
+    if session_id is None:
+      if not prime:
+        raise ValueError('a new session needs a non-empty prime')
+      session_id = uuid.uuid4().hex
+      state = (None,
+               np.zeros(self.units, dtype=np.float32),
+               np.zeros(self.units, dtype=np.float32))
+    else:
+      with self._lock:
+        state = self._sessions.pop(session_id)
+
+    logits, h, c = state
+    try:
+      for char in prime:
+        logits, h, c = self.batcher.step(self.char2idx[char], h, c)
+
+      text_generated = []
+      for _ in range(num_generate):
+        # sample on the host, a single row does not need the accelerator
+        scaled = logits / temperature
+        probs = np.exp(scaled - scaled.max())
+        predicted_id = np.random.choice(len(probs), p=probs / probs.sum())
+        text_generated.append(self.idx2char[predicted_id])
+        logits, h, c = self.batcher.step(predicted_id, h, c)
+    except Exception:
+      # keep the session where it was before this request
+      if state[0] is not None:
+        with self._lock:
+          self._sessions[session_id] = state
+      raise
+
+    with self._lock:
+      self._sessions[session_id] = (logits, h, c)
+
+    return session_id, ''.join(text_generated)
+
+  def close(self, session_id):
+    with self._lock:
+      self._sessions.pop(session_id, None)
+
+
+class GenerationHandler(BaseHTTPRequestHandler):
+
+  def do_POST(self):
+    sessions = self.server.sessions
+    try:
+      request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+      if self.path == '/generate':
+        session_id, text = sessions.generate(request.get('session'),
+                                             request.get('prime', ''),
+                                             int(request.get('num_generate', 100)),
+                                             float(request.get('temperature', 1.0)))
+        response = {'session': session_id, 'text': text}
+      elif self.path == '/close':
+        sessions.close(request['session'])
+        response = {}
+      else:
+        self.send_error(404)
+        return
+    except (KeyError, ValueError) as e:
+      self.send_error(400, str(e))
+      return
+
+    body = json.dumps(response).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def serve(export_dir, port=8000, max_batch_size=256, max_wait=0.002):
+  step = tf.saved_model.load(export_dir)
+  server = ThreadingHTTPServer(('', port), GenerationHandler)
+  server.sessions = GenerationSessions(step, max_batch_size, max_wait)
+  print('Serving {} on port {}'.format(export_dir, port))
+  server.serve_forever()
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--export_dir', default='./char_rnn_step')
+  parser.add_argument('--port', type=int, default=8000)
+  parser.add_argument('--max_batch_size', type=int, default=256)
+  parser.add_argument('--max_wait', type=float, default=0.002,
+                      help='seconds to wait for more sessions before running a batch')
+  args = parser.parse_args()
+
+  serve(args.export_dir, args.port, args.max_batch_size, args.max_wait)
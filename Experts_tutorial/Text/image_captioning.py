@@ -24,10 +24,15 @@ from sklearn.utils import shuffle
 
 import numpy as np
 import os
+import sys
 import time
 import json
 from PIL import Image
 
+# the shared image loading of `Load_data/jpeg_decode.py`
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Load_data'))
+import jpeg_decode
+
 """## Download and prepare the MS-COCO dataset
 
 You will use the [MS-COCO dataset](http://cocodataset.org/#home) to train our model. The dataset contains over 82,000 images, each of which has at least 5 different caption annotations. The code below downloads and extracts the dataset automatically.
@@ -95,7 +100,8 @@ First, you will convert the images into InceptionV3's expected format by:
 
 def load_image(image_path):
   img = tf.io.read_file(image_path)
-  img = tf.image.decode_jpeg(img, channels=3)
+  # decode at the smallest DCT scale that is still at least 299x299
+  img = jpeg_decode.decode_jpeg(img, (299, 299), channels=3)
   img = tf.image.resize(img, (299, 299))
   img = tf.keras.applications.inception_v3.preprocess_input(img)
   return img, image_path
@@ -376,6 +382,7 @@ if ckpt_manager.latest_checkpoint:
 * Use teacher forcing to decide the next input to the decoder.
 * Teacher forcing is the technique where the target word is passed as the next input to the decoder.
 * The final step is to calculate the gradients and apply it to the optimizer and backpropagate.
+* The decoder loop runs over a `tf.range`, which AutoGraph compiles into a single `tf.while_loop`, and the batch size is read from the target tensor, so one trace serves every batch (including the last, partial one) and every caption length.
 """
 
 # adding this in a separate cell because if you run the training cell
@@ -383,20 +390,30 @@ if ckpt_manager.latest_checkpoint:
 loss_plot = []
 
 
-@tf.function
+@tf.function(input_signature=[
+  tf.TensorSpec(shape=(None, attention_features_shape, features_shape), dtype=tf.float32),
+  tf.TensorSpec(shape=(None, None), dtype=tf.int32)])
 def train_step(img_tensor, target):
-  loss = 0
+  loss = tf.constant(0.0)
+
+  # Use the dynamic batch size so the last partial batch neither breaks the
+  # start tokens below nor retraces the function
+  batch_size = tf.shape(target)[0]
+  seq_length = tf.shape(target)[1]
 
   # initializing the hidden state for each batch
   # because the captions are not related from image to image
-  hidden = decoder.reset_state(batch_size=target.shape[0])
+  hidden = decoder.reset_state(batch_size=batch_size)
 
-  dec_input = tf.expand_dims([tokenizer.word_index['<start>']] * BATCH_SIZE, 1)
+  dec_input = tf.fill([batch_size, 1], tokenizer.word_index['<start>'])
 
   with tf.GradientTape() as tape:
     features = encoder(img_tensor)
 
-    for i in range(1, target.shape[1]):
+    # Iterating over a `tf.range` makes AutoGraph emit a single `tf.while_loop`
+    # instead of unrolling one decoder call per caption position, so the
+    # trace time stays constant no matter how long the captions are
+    for i in tf.range(1, seq_length):
       # passing the features through the decoder
       predictions, hidden, _ = decoder(dec_input, features, hidden)
 
@@ -405,7 +422,7 @@ def train_step(img_tensor, target):
       # using teacher forcing
       dec_input = tf.expand_dims(target[:, i], 1)
 
-  total_loss = (loss / int(target.shape[1]))
+  total_loss = (loss / tf.cast(seq_length, loss.dtype))
 
   trainable_variables = encoder.trainable_variables + decoder.trainable_variables
 
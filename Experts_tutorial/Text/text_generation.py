@@ -21,6 +21,9 @@ import numpy as np
 import os
 import time
 
+from char_rnn import encode_corpus, export_step, generate_samples, load_corpus, make_sampler, \
+  random_window_dataset, truncated_bptt_dataset
+
 # Download the Shakespeare dataset
 path_to_file = tf.keras.utils.get_file('shakespeare.txt', 'https://storage.googleapis.com/download.tensorflow.org'
                                                           '/data/shakespeare.txt')
@@ -143,6 +146,23 @@ BUFFER_SIZE = 10000
 
 dataset = dataset.shuffle(BUFFER_SIZE).batch(BATCH_SIZE, drop_remainder=True)
 
+"""### Training on corpora that don't fit in memory
+
+The pipeline above keeps the whole text, and its integer encoding, in memory, and always cuts it at the same `seq_length + 1` boundaries. For larger corpora, `encode_corpus` streams the text in chunks, once to find the vocabulary and once to encode it into a `uint8` (or `uint16` for large vocabularies) `.npy` file, which `load_corpus` memory-maps. `random_window_dataset` then draws random window offsets inside the `tf.data` graph, so only the sampled windows are read from disk and every epoch sees different alignments.
+
+It yields the same `(input, target)` batches as `dataset`, so it can be passed to `model.fit` instead.
+"""
+
+encode_corpus(path_to_file, 'shakespeare.npy')
+corpus, corpus_vocab = load_corpus('shakespeare.npy')
+assert corpus_vocab == vocab
+
+mmap_dataset = random_window_dataset(corpus, seq_length, BATCH_SIZE)
+
+for mmap_input, mmap_target in mmap_dataset.take(1):
+  print('Input data: ', repr(''.join(idx2char[mmap_input[0].numpy()])))
+  print('Target data:', repr(''.join(idx2char[mmap_target[0].numpy()])))
+
 
 """## Build The Model
 
@@ -347,6 +367,50 @@ def generate_text(model, start_string):
 
 print(generate_text(model, start_string=u"ROMEO: "))
 
+"""### Generating many samples at once
+
+`generate_text` runs one eager step per character at batch size 1 and copies every prediction back with `.numpy()`. `generate_samples` runs the whole loop inside a single `tf.function` and generates one independent sample per row of the batch, so rebuild the model with the number of samples as batch size.
+
+Each sample can use its own temperature, and the predictions can be restricted to the `top_k` most likely characters or to the smallest set of characters whose probability adds up to `top_p` (nucleus sampling).
+"""
+
+num_samples = 16
+
+sampler_model = build_model(vocab_size, embedding_dim, rnn_units, batch_size=num_samples)
+sampler_model.load_weights(tf.train.latest_checkpoint(checkpoint_dir))
+sampler_model.build(tf.TensorShape([num_samples, None]))
+
+sampler = make_sampler(sampler_model)
+
+# The first call traces the loop, the second one shows the steady-state characters/sec
+for _ in range(2):
+  samples = generate_samples(sampler_model, char2idx, idx2char, start_string=u"ROMEO: ",
+                             temperature=np.linspace(0.5, 1.5, num_samples),
+                             top_k=20, top_p=0.95, sampler=sampler)
+
+print(samples[0])
+
+"""### Exporting a stateless step for serving
+
+The stateful LSTM keeps one state per row of its fixed batch, so a model can only serve as many sessions as its batch size, and changing the batch size means rebuilding the model. `export_step` copies the trained weights into a `tf.Module` whose step takes the LSTM state as input and returns the new one: `(ids, h, c) -> (logits, h, c)`, for any batch size.
+
+`char_rnn_server.py` loads the exported SavedModel, keeps the state of every generation session and batches the steps of all the sessions running at the same time into one call:
+
+```
+python char_rnn_server.py --export_dir ./char_rnn_step --port 8000
+```
+"""
+
+step = export_step(model, vocab, './char_rnn_step')
+
+# The step gives the same predictions as the stateful model
+model.reset_states()
+h = c = tf.zeros((1, rnn_units))
+for char in u"ROMEO: ":
+  step_logits, h, c = step(tf.constant([char2idx[char]]), h, c)
+model_logits = model(tf.constant([[char2idx[char] for char in u"ROMEO: "]]))[:, -1, :]
+print('Max difference:', tf.reduce_max(tf.abs(step_logits - model_logits)).numpy())
+
 """The easiest thing you can do to improve the results it to train it for longer (try `EPOCHS=30`).
 
 You can also experiment with a different start string, or try adding another RNN layer to improve the model's accuracy, or adjusting the temperature parameter to generate more or less random predictions.
@@ -370,8 +434,23 @@ The procedure works as follows:
 * Calculate the gradients of the loss with respect to the model variables using the `tf.GradientTape.grads` method.
 
 * Finally, take a step downwards by using the optimizer's `tf.train.Optimizer.apply_gradients` method.
+
+### Truncated backpropagation through time
+
+The LSTM is stateful, so the state at the end of a batch is the initial state of the next one. With the shuffled `dataset` that state comes from an unrelated chunk of text. `truncated_bptt_dataset` instead cuts the text into `BATCH_SIZE` contiguous streams and walks through them in order, so each row of a batch continues the same row of the previous batch and the carried state is real context.
+
+Gradients only flow back through `UNROLL_LENGTH` characters: a shorter unroll gives faster steps and less memory per step, a longer one lets the model learn longer dependencies. The effective context is no longer limited to `seq_length`.
 """
 
+# Set to False to train on the shuffled, independent chunks instead
+TRUNCATED_BPTT = True
+UNROLL_LENGTH = 100
+
+if TRUNCATED_BPTT:
+  train_dataset = truncated_bptt_dataset(text_as_int, BATCH_SIZE, UNROLL_LENGTH)
+else:
+  train_dataset = dataset
+
 model = build_model(
   vocab_size=len(vocab),
   embedding_dim=embedding_dim,
@@ -404,7 +483,7 @@ for epoch in range(EPOCHS):
   # initally hidden is None
   hidden = model.reset_states()
 
-  for (batch_n, (inp, target)) in enumerate(dataset):
+  for (batch_n, (inp, target)) in enumerate(train_dataset):
     loss = train_step(inp, target)
 
     if batch_n % 100 == 0:
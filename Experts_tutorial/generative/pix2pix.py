@@ -24,10 +24,16 @@ import tensorflow as tf
 from tensorflow.python import keras
 
 import os
+import sys
 import time
 import matplotlib.pyplot as plt
 from IPython.display import clear_output
 
+# the shared image loading of `Load_data/jpeg_decode.py` and `Load_data/image_manifest.py`
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Load_data'))
+import image_manifest
+import jpeg_decode
+
 # Load the dataset
 _URL = 'https://people.eecs.berkeley.edu/~tinghuiz/projects/pix2pix/datasets/facades.tar.gz'
 
@@ -45,7 +51,9 @@ IMG_HEIGHT = 256
 
 def load(image_file):
   image = tf.io.read_file(image_file)
-  image = tf.image.decode_jpeg(image)
+  # both halves are resized to at most 286x286 afterwards, decode at the
+  # smallest DCT scale that still covers that
+  image = jpeg_decode.decode_jpeg(image, [286, 2 * 286], channels=3)
 
   w = tf.shape(image)[1]
 
@@ -139,13 +147,21 @@ def load_image_test(image_file):
 
 
 # Input Pipeline
-train_dataset = tf.data.Dataset.list_files(PATH + 'train/*.jpg')
+# The image lists are kept in manifests next to the data, so later runs don't
+# list the directories again unless they changed.
+def list_images(directory):
+  manifest = image_manifest.load_or_scan(directory, os.path.normpath(directory) + '.manifest.npz',
+                                         extensions=('.jpg',))
+  return manifest.paths()
+
+
+train_dataset = tf.data.Dataset.from_tensor_slices(list_images(PATH + 'train'))
 train_dataset = train_dataset.shuffle(BUFFER_SIZE)
 train_dataset = train_dataset.map(load_image_train,
                                   num_parallel_calls=tf.data.experimental.AUTOTUNE)
 train_dataset = train_dataset.batch(1)
 
-test_dataset = tf.data.Dataset.list_files(PATH + 'test/*.jpg')
+test_dataset = tf.data.Dataset.from_tensor_slices(list_images(PATH + 'test'))
 test_dataset = test_dataset.shuffle(BUFFER_SIZE)
 test_dataset = test_dataset.map(load_image_test)
 test_dataset = test_dataset.batch(1)
@@ -16,6 +16,7 @@ from tensorflow import keras
 
 import numpy as np
 import matplotlib.pyplot as plt
+import time
 
 print(tf.__version__)
 
@@ -39,6 +40,9 @@ def multi_hot_sequences(sequences, dimension):
     return results
 
 
+# Keep the word indices, the sparse inputs at the end of this guide are built from them
+train_sequences, test_sequences = train_data, test_data
+
 train_data = multi_hot_sequences(train_data, dimension=NUM_WORDS)
 test_data = multi_hot_sequences(test_data, dimension=NUM_WORDS)
 
@@ -251,3 +255,111 @@ To recap: here are the most common ways to prevent overfitting in neural network
 
 And two important approaches not covered in this guide are data-augmentation and batch normalization.
 """
+
+"""## Sparse multi-hot inputs
+
+The dense multi-hot matrices above hold `len(sequences) * NUM_WORDS` float64 values, about 2 GB per split, although a review only uses a few hundred different words. Building them row by row in Python is also slow.
+
+`multi_hot_sparse` builds the same matrix as a `tf.SparseTensor` in one vectorized pass, storing only the non-zero entries. `SparseDense` replaces the first `Dense` layer with a sparse-dense matrix multiplication, so the dense matrix is never created and `NUM_WORDS` can grow to 100k and more.
+"""
+
+
+def multi_hot_sparse(sequences, dimension):
+    lengths = np.array([len(word_indices) for word_indices in sequences])
+    rows = np.repeat(np.arange(len(sequences)), lengths)
+    cols = np.concatenate(sequences).astype(np.int64)
+
+    # A word can appear several times in a review, but is only set once.
+    # np.unique also sorts the entries in the row-major order tf.sparse expects.
+    flat = np.unique(rows * dimension + cols)
+
+    return tf.SparseTensor(indices=np.stack([flat // dimension, flat % dimension], axis=1),
+                           values=np.ones(len(flat), dtype=np.float32),
+                           dense_shape=(len(sequences), dimension))
+
+
+class SparseDense(keras.layers.Layer):
+    """`Dense` layer that takes a `tf.SparseTensor` as input."""
+
+    def __init__(self, units, activation=None, **kwargs):
+        super(SparseDense, self).__init__(**kwargs)
+        self.units = units
+        self.activation = keras.activations.get(activation)
+
+    def build(self, input_shape):
+        self.kernel = self.add_weight(name='kernel', shape=(int(input_shape[-1]), self.units),
+                                      initializer='glorot_uniform')
+        self.bias = self.add_weight(name='bias', shape=(self.units,), initializer='zeros')
+
+    def call(self, inputs):
+        return self.activation(tf.sparse.sparse_dense_matmul(inputs, self.kernel) + self.bias)
+
+
+sparse_train_data = multi_hot_sparse(train_sequences, dimension=NUM_WORDS)
+sparse_test_data = multi_hot_sparse(test_sequences, dimension=NUM_WORDS)
+
+
+def sparse_bytes(sparse):
+    return sparse.indices.numpy().nbytes + sparse.values.numpy().nbytes
+
+
+print('Dense train data:  {:8.1f} MB'.format(train_data.nbytes / 2 ** 20))
+print('Sparse train data: {:8.1f} MB'.format(sparse_bytes(sparse_train_data) / 2 ** 20))
+
+"""The sparse matrices are fed through `tf.data`, which slices and batches them without densifying them. Let's compare the baseline model on both input paths:"""
+
+sparse_train_dataset = tf.data.Dataset.from_tensor_slices((sparse_train_data, train_labels))
+sparse_train_dataset = sparse_train_dataset.shuffle(len(train_labels)).batch(512)
+sparse_test_dataset = tf.data.Dataset.from_tensor_slices((sparse_test_data, test_labels)).batch(512)
+
+sparse_inputs = keras.Input(shape=(NUM_WORDS,), sparse=True)
+x = SparseDense(16, activation='relu')(sparse_inputs)
+x = keras.layers.Dense(16, activation='relu')(x)
+sparse_outputs = keras.layers.Dense(1, activation='sigmoid')(x)
+sparse_model = keras.Model(sparse_inputs, sparse_outputs)
+
+sparse_model.compile(optimizer='adam',
+                     loss='binary_crossentropy',
+                     metrics=['accuracy', 'binary_crossentropy'])
+
+dense_model = keras.Sequential([
+    keras.layers.Dense(16, activation='relu', input_shape=(NUM_WORDS,)),
+    keras.layers.Dense(16, activation='relu'),
+    keras.layers.Dense(1, activation='sigmoid')
+])
+
+dense_model.compile(optimizer='adam',
+                    loss='binary_crossentropy',
+                    metrics=['accuracy', 'binary_crossentropy'])
+
+COMPARE_EPOCHS = 5
+
+start = time.time()
+dense_history = dense_model.fit(train_data, train_labels,
+                                epochs=COMPARE_EPOCHS,
+                                batch_size=512,
+                                validation_data=(test_data, test_labels),
+                                verbose=2)
+dense_epoch_time = (time.time() - start) / COMPARE_EPOCHS
+
+start = time.time()
+sparse_history = sparse_model.fit(sparse_train_dataset,
+                                  epochs=COMPARE_EPOCHS,
+                                  validation_data=sparse_test_dataset,
+                                  verbose=2)
+sparse_epoch_time = (time.time() - start) / COMPARE_EPOCHS
+
+print('Dense:  {:.2f} sec/epoch'.format(dense_epoch_time))
+print('Sparse: {:.2f} sec/epoch'.format(sparse_epoch_time))
+
+plot_history([('dense', dense_history),
+              ('sparse', sparse_history)])
+
+"""## Running the comparisons in parallel
+
+The models above train one after another, and the small ones leave most cores idle. `overfit_sweep.py` trains the baseline, smaller, bigger, L2 and dropout variants in a process pool instead. The multi-hot data is written once to `.npy` files that every process memory-maps read-only, each process gets its share of the cores as intra-op threads, and the histories end up in one CSV table:
+
+```
+python overfit_sweep.py --epochs 20
+```
+"""
@@ -0,0 +1,209 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Train the `overfit_and_underfit.py` model variants in parallel.
+
+The multi-hot IMDB data is written once to `.npy` files, which every worker
+memory-maps read-only, so the operating system keeps a single copy in its page
+cache. Each variant then trains in its own process with a fixed number of
+intra-op threads, and the histories are collected into one table:
+
+    python overfit_sweep.py --variants baseline smaller bigger l2 dropout
+"""
+
+import numpy as np
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+
+NUM_WORDS = 10000
+
+
+def build_variant(name, num_words):
+    from tensorflow import keras
+
+    if name == 'baseline':
+        layers = [keras.layers.Dense(16, activation='relu', input_shape=(num_words,)),
+                  keras.layers.Dense(16, activation='relu')]
+    elif name == 'smaller':
+        layers = [keras.layers.Dense(4, activation='relu', input_shape=(num_words,)),
+                  keras.layers.Dense(4, activation='relu')]
+    elif name == 'bigger':
+        layers = [keras.layers.Dense(512, activation='relu', input_shape=(num_words,)),
+                  keras.layers.Dense(512, activation='relu')]
+    elif name == 'l2':
+        layers = [keras.layers.Dense(16, kernel_regularizer=keras.regularizers.l2(0.001),
+                                     activation='relu', input_shape=(num_words,)),
+                  keras.layers.Dense(16, kernel_regularizer=keras.regularizers.l2(0.001),
+                                     activation='relu')]
+    elif name == 'dropout':
+        layers = [keras.layers.Dense(16, activation='relu', input_shape=(num_words,)),
+                  keras.layers.Dropout(0.5),
+                  keras.layers.Dense(16, activation='relu'),
+                  keras.layers.Dropout(0.5)]
+    else:
+        raise ValueError('Unknown variant: {}'.format(name))
+
+    model = keras.Sequential(layers + [keras.layers.Dense(1, activation='sigmoid')])
+    model.compile(optimizer='adam',
+                  loss='binary_crossentropy',
+                  metrics=['accuracy', 'binary_crossentropy'])
+    return model
+
+
+VARIANTS = ['baseline', 'smaller', 'bigger', 'l2', 'dropout']
+
+
+def write_multi_hot(sequences, dimension, path, chunk_size=1024):
+    """Write the multi-hot matrix of `sequences` to a float32 `.npy` file, chunk by chunk."""
+    results = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                        shape=(len(sequences), dimension))
+    for start in range(0, len(sequences), chunk_size):
+        chunk = sequences[start:start + chunk_size]
+        rows = np.repeat(np.arange(len(chunk)), [len(word_indices) for word_indices in chunk])
+        block = np.zeros((len(chunk), dimension), dtype=np.float32)
+        block[rows, np.concatenate(chunk)] = 1.0
+        results[start:start + len(chunk)] = block
+    results.flush()
+
+
+def prepare_data(data_dir, num_words=NUM_WORDS):
+    """Download IMDB and write the memory-mappable splits, once."""
+    paths = {name: os.path.join(data_dir, '{}_{}.npy'.format(name, num_words))
+             for name in ['train_data', 'train_labels', 'test_data', 'test_labels']}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    from tensorflow import keras
+
+    os.makedirs(data_dir, exist_ok=True)
+    (train_data, train_labels), (test_data, test_labels) = keras.datasets.imdb.load_data(
+        num_words=num_words)
+    write_multi_hot(train_data, num_words, paths['train_data'])
+    write_multi_hot(test_data, num_words, paths['test_data'])
+    np.save(paths['train_labels'], train_labels.astype(np.float32))
+    np.save(paths['test_labels'], test_labels.astype(np.float32))
+    return paths
+
+
+def _train_variant(args):
+    name, paths, num_words, epochs, batch_size, intra_op_threads = args
+
+    # The thread pools have to be configured before TensorFlow runs anything
+    import tensorflow as tf
+    from tensorflow import keras
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    class MemmapSequence(keras.utils.Sequence):
+        """Batches sliced from the memory-mapped arrays, the arrays are never copied whole."""
+
+        def __init__(self, data_path, labels_path, shuffle):
+            self.data = np.load(data_path, mmap_mode='r')
+            self.labels = np.load(labels_path, mmap_mode='r')
+            self.shuffle = shuffle
+            self.order = np.arange(len(self.labels))
+            self.on_epoch_end()
+
+        def __len__(self):
+            return (len(self.labels) + batch_size - 1) // batch_size
+
+        def __getitem__(self, index):
+            batch = np.sort(self.order[index * batch_size:(index + 1) * batch_size])
+            return self.data[batch], self.labels[batch]
+
+        def on_epoch_end(self):
+            if self.shuffle:
+                np.random.shuffle(self.order)
+
+    model = build_variant(name, num_words)
+    start = time.time()
+    history = model.fit(MemmapSequence(paths['train_data'], paths['train_labels'], shuffle=True),
+                        epochs=epochs,
+                        validation_data=MemmapSequence(paths['test_data'], paths['test_labels'],
+                                                       shuffle=False),
+                        verbose=0)
+    return name, history.history, time.time() - start
+
+
+def run_sweep(variants=VARIANTS, data_dir='./imdb_multi_hot', num_words=NUM_WORDS,
+              epochs=20, batch_size=512, num_workers=None, intra_op_threads=None):
+    """Train `variants` in a process pool.
+
+    Args:
+        variants: names of the variants to train, see `build_variant`.
+        data_dir: where the memory-mapped multi-hot splits are written.
+        num_words: size of the multi-hot vectors.
+        epochs: training epochs for every variant.
+        batch_size: training batch size for every variant.
+        num_workers: number of processes, defaults to one per variant.
+        intra_op_threads: TensorFlow threads per process, defaults to sharing the
+                          cores evenly between the processes.
+
+    Returns:
+        list of rows, one per variant and epoch, with the training time and the
+        history metrics.
+    """
+    paths = prepare_data(data_dir, num_words)
+    num_workers = num_workers or len(variants)
+    intra_op_threads = intra_op_threads or max(1, multiprocessing.cpu_count() // num_workers)
+
+    # spawn, so no worker inherits the TensorFlow runtime of the parent
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(num_workers) as pool:
+        results = pool.map(_train_variant,
+                           [(name, paths, num_words, epochs, batch_size, intra_op_threads)
+                            for name in variants],
+                           chunksize=1)
+
+    table = []
+    for name, history, duration in results:
+        for epoch in range(len(history['loss'])):
+            row = {'variant': name, 'epoch': epoch + 1, 'train_time': duration}
+            row.update({key: values[epoch] for key, values in history.items()})
+            table.append(row)
+    return table
+
+
+def write_table(table, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(table[0].keys()))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--variants', nargs='+', default=VARIANTS, choices=VARIANTS)
+    parser.add_argument('--data_dir', default='./imdb_multi_hot')
+    parser.add_argument('--num_words', type=int, default=NUM_WORDS)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch_size', type=int, default=512)
+    parser.add_argument('--num_workers', type=int, default=None)
+    parser.add_argument('--intra_op_threads', type=int, default=None)
+    parser.add_argument('--output', default='overfit_sweep.csv')
+    args = parser.parse_args()
+
+    start = time.time()
+    table = run_sweep(args.variants, args.data_dir, args.num_words, args.epochs,
+                      args.batch_size, args.num_workers, args.intra_op_threads)
+    write_table(table, args.output)
+
+    for row in table:
+        if row['epoch'] == args.epochs:
+            print('{:10s} {:6.1f} sec  val_binary_crossentropy {:.4f}  val_accuracy {:.4f}'.format(
+                row['variant'], row['train_time'], row['val_binary_crossentropy'], row['val_accuracy']))
+    print('Sweep took {:.1f} sec, histories written to {}'.format(time.time() - start, args.output))
@@ -32,6 +32,8 @@ from tensorflow.python import keras
 
 import matplotlib.pyplot as plt
 
+from imdb_pipeline import EpochTimer, bucket_boundaries, bucketed_dataset, print_comparison
+
 # Download the IMDB dataset
 imdb = keras.datasets.imdb
 
@@ -58,6 +60,9 @@ def decode_review(text):
   return ' '.join([reverse_word_index.get(i, '?') for i in text])
 
 
+# Keep the unpadded reviews for the bucketed pipeline at the end of this tutorial
+train_sequences, test_sequences = train_data, test_data
+
 # Prepare the data
 train_data = keras.preprocessing.sequence.pad_sequences(train_data,
                                                         value=word_index["<PAD>"],
@@ -107,12 +112,14 @@ y_val = train_labels[:10000]
 partial_y_train = train_labels[10000:]
 
 # Train the model
+padded_timer = EpochTimer()
 history = model.fit(partial_x_train,
                     partial_y_train,
                     epochs=40,
                     batch_size=512,
                     validation_data=(x_val, y_val),
-                    verbose=1)
+                    verbose=1,
+                    callbacks=[padded_timer])
 
 # Evaluate the model
 results = model.evaluate(test_data, test_labels)
@@ -150,3 +157,38 @@ plt.ylabel('Accuracy')
 plt.legend()
 
 plt.show()
+
+# Train from a length-bucketed pipeline
+# Padding every review to 256 words makes short reviews pay for the full length
+# and truncates long ones. Bucketing groups reviews of similar length and pads
+# each batch only to its longest review, and `mask_zero=True` makes
+# GlobalAveragePooling1D ignore the padding.
+boundaries = bucket_boundaries(train_sequences)
+
+bucketed_train = bucketed_dataset(train_sequences[10000:], train_labels[10000:], boundaries)
+bucketed_val = bucketed_dataset(train_sequences[:10000], train_labels[:10000], boundaries,
+                                shuffle=False)
+bucketed_test = bucketed_dataset(test_sequences, test_labels, boundaries, shuffle=False)
+
+bucketed_model = keras.Sequential([
+  keras.layers.Embedding(vocab_size, 16, mask_zero=True),
+  keras.layers.GlobalAveragePooling1D(),
+  keras.layers.Dense(16, activation=tf.nn.relu),
+  keras.layers.Dense(1, activation=tf.nn.sigmoid)
+])
+
+bucketed_model.compile(optimizer=tf.optimizers.Adam(),
+                       loss=tf.losses.BinaryCrossentropy(),
+                       metrics=['accuracy'])
+
+bucketed_timer = EpochTimer()
+bucketed_history = bucketed_model.fit(bucketed_train,
+                                      epochs=40,
+                                      validation_data=bucketed_val,
+                                      verbose=1,
+                                      callbacks=[bucketed_timer])
+
+print(bucketed_model.evaluate(bucketed_test))
+
+print_comparison([('padded-256', history, padded_timer),
+                  ('bucketed', bucketed_history, bucketed_timer)])
@@ -0,0 +1,144 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Approximate nearest-neighbor index over learned word embeddings.
+
+The index is an inverted file (IVF): the normalized vectors are clustered with
+k-means, and a query only scores the words of the `nprobe` clusters whose
+centroids are the most similar to it, instead of the whole vocabulary.
+Similarities are cosine similarities. Only NumPy is needed to build, save,
+load and query the index.
+"""
+
+import numpy as np
+import json
+import os
+
+
+def _normalize(vectors):
+  norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+  return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def _kmeans(vectors, num_lists, iterations, seed):
+  rng = np.random.RandomState(seed)
+  centroids = vectors[rng.choice(len(vectors), num_lists, replace=False)]
+  for _ in range(iterations):
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    for i in range(num_lists):
+      members = vectors[assignments == i]
+      # an empty cluster keeps its centroid
+      if len(members):
+        centroids[i] = members.mean(axis=0)
+    centroids = _normalize(centroids)
+  return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class EmbeddingIndex(object):
+  """Inverted-file index over the rows of an embedding matrix."""
+
+  FILES = ('vectors.npy', 'centroids.npy', 'list_offsets.npy', 'list_ids.npy')
+
+  def __init__(self, vectors, centroids, list_offsets, list_ids, words):
+    self.vectors = vectors
+    self.centroids = centroids
+    self.list_offsets = list_offsets
+    self.list_ids = list_ids
+    self.words = words
+    self.word_ids = {word: i for i, word in enumerate(words)}
+
+  @classmethod
+  def build(cls, embeddings, words, num_lists=None, iterations=10, seed=0):
+    """Cluster `embeddings` into `num_lists` inverted lists.
+
+    Args:
+      embeddings: matrix with shape == (vocab_size, embedding_dim), for example
+                  the weights of a `tf.keras.layers.Embedding`.
+      words: the word of every row.
+      num_lists: number of clusters, defaults to the square root of the vocabulary size.
+      iterations: k-means iterations.
+      seed: seed of the k-means initialization.
+    """
+    vectors = _normalize(np.asarray(embeddings))
+    num_lists = num_lists or max(1, int(np.sqrt(len(vectors))))
+    centroids, assignments = _kmeans(vectors, num_lists, iterations, seed)
+
+    list_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+    list_offsets = np.concatenate(
+      [[0], np.cumsum(np.bincount(assignments, minlength=num_lists))]).astype(np.int64)
+    return cls(vectors, centroids, list_offsets, list_ids, list(words))
+
+  def save(self, directory):
+    os.makedirs(directory, exist_ok=True)
+    arrays = (self.vectors, self.centroids, self.list_offsets, self.list_ids)
+    for name, array in zip(self.FILES, arrays):
+      np.save(os.path.join(directory, name), array)
+    with open(os.path.join(directory, 'words.json'), 'w', encoding='utf-8') as f:
+      json.dump(self.words, f)
+
+  @classmethod
+  def load(cls, directory):
+    """Load an index written by `save`, the arrays are memory-mapped."""
+    arrays = [np.load(os.path.join(directory, name), mmap_mode='r') for name in cls.FILES]
+    with open(os.path.join(directory, 'words.json'), 'r', encoding='utf-8') as f:
+      words = json.load(f)
+    return cls(*arrays, words=words)
+
+  def search(self, queries, k=10, nprobe=8):
+    """Approximate top-k cosine neighbors of a batch of query vectors.
+
+    Args:
+      queries: matrix with shape == (num_queries, embedding_dim).
+      k: number of neighbors per query.
+      nprobe: number of inverted lists scanned per query, more lists give
+              better recall and slower queries.
+
+    Returns:
+      ids and similarities with shape == (num_queries, k), best first. Rows with
+      fewer than `k` candidates are padded with id `-1` and similarity `-inf`.
+    """
+    queries = _normalize(np.atleast_2d(queries))
+    nprobe = min(nprobe, len(self.centroids))
+
+    # the centroids of the whole batch are scored in one matrix multiplication
+    centroid_scores = queries @ self.centroids.T
+    probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    for i, query in enumerate(queries):
+      candidates = np.concatenate(
+        [self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes[i]])
+      candidate_scores = self.vectors[candidates] @ query
+
+      n = min(k, len(candidates))
+      if n == 0:
+        continue
+      top = np.argpartition(-candidate_scores, n - 1)[:n]
+      top = top[np.argsort(-candidate_scores[top])]
+      ids[i, :n] = candidates[top]
+      scores[i, :n] = candidate_scores[top]
+    return ids, scores
+
+  def most_similar(self, words, k=10, nprobe=8):
+    """The `k` most similar words of each word in `words`, as (word, similarity) lists."""
+    query_ids = [self.word_ids[word] for word in words]
+    # ask for one more neighbor, the query word is its own best match
+    ids, scores = self.search(self.vectors[query_ids], k + 1, nprobe)
+
+    results = []
+    for query_id, row_ids, row_scores in zip(query_ids, ids, scores):
+      results.append([(self.words[i], float(score))
+                      for i, score in zip(row_ids, row_scores)
+                      if i != query_id and i >= 0][:k])
+    return results
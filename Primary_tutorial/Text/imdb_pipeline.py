@@ -0,0 +1,85 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Length-bucketed `tf.data` input pipeline for the IMDB text models."""
+
+import tensorflow as tf
+
+import numpy as np
+import time
+
+
+def bucket_boundaries(sequences, num_buckets=8):
+  """Bucket boundaries that split the reviews into buckets of similar size."""
+  lengths = np.array([len(sequence) for sequence in sequences])
+  quantiles = np.percentile(lengths, np.linspace(0, 100, num_buckets + 1)[1:-1])
+  return sorted(set(int(q) + 1 for q in quantiles))
+
+
+def bucketed_dataset(sequences, labels, boundaries, batch_size=512, max_length=None,
+                     shuffle=True, pad_value=0):
+  """Batches of reviews with similar lengths, padded to the longest review of each batch.
+
+  Args:
+    sequences: list of word index lists, as returned by `imdb.load_data`.
+    labels: one label per review.
+    boundaries: upper length bounds of the buckets, see `bucket_boundaries`.
+    batch_size: number of reviews per batch.
+    max_length: optional truncation length, `None` keeps every review whole.
+    shuffle: shuffle the reviews before bucketing them.
+    pad_value: word index used for padding, it must be masked by the model.
+
+  Returns:
+    a `tf.data.Dataset` of (reviews, labels) batches.
+  """
+  lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+  if max_length is not None:
+    lengths = np.minimum(lengths, max_length)
+  starts = np.concatenate([[0], np.cumsum([len(sequence) for sequence in sequences])[:-1]])
+
+  # All the reviews are kept in one flat tensor, each element is sliced from it
+  # in the graph, so there is no Python generator in the pipeline.
+  flat = tf.constant(np.concatenate(sequences).astype(np.int32))
+
+  dataset = tf.data.Dataset.from_tensor_slices((starts, lengths, np.asarray(labels)))
+  if shuffle:
+    dataset = dataset.shuffle(len(lengths))
+  dataset = dataset.map(lambda start, length, label: (tf.slice(flat, [start], [length]), label),
+                        num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  dataset = dataset.apply(tf.data.experimental.bucket_by_sequence_length(
+    element_length_func=lambda review, label: tf.shape(review)[0],
+    bucket_boundaries=boundaries,
+    bucket_batch_sizes=[batch_size] * (len(boundaries) + 1),
+    padded_shapes=([None], []),
+    padding_values=(pad_value, tf.constant(0, dtype=tf.as_dtype(np.asarray(labels).dtype)))))
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+  """Records the wall-clock time of every training epoch."""
+
+  def on_train_begin(self, logs=None):
+    self.times = []
+
+  def on_epoch_begin(self, epoch, logs=None):
+    self.start = time.time()
+
+  def on_epoch_end(self, epoch, logs=None):
+    self.times.append(time.time() - self.start)
+
+
+def print_comparison(results):
+  """Print the mean epoch time and final validation accuracy of (name, history, timer) tuples."""
+  for name, history, timer in results:
+    print('{:12s} {:6.2f} sec/epoch  val_accuracy {:.4f}'.format(
+      name, np.mean(timer.times), history.history['val_accuracy'][-1]))
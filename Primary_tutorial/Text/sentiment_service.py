@@ -0,0 +1,124 @@
+# Copyright 2019 ChangyuLiu Authors. All Rights Reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Batched, cached inference for the RNN sentiment classifier.
+
+Request payload:
+
+    {"texts": ["The movie was cool.", "I would not recommend this movie."]}
+
+Response payload, one prediction per text and in the same order:
+
+    {"predictions": [0.93, 0.08]}
+
+A prediction >= 0.5 is positive, otherwise it is negative.
+
+The texts are tokenized together, grouped by token length so that a batch is
+only padded up to the next multiple of `pad_to_multiple`, and run through one
+compiled forward pass per group. The padding is appended after the text, like
+`padded_batch` does during training. Results are memoized per text.
+"""
+
+import tensorflow as tf
+
+import numpy as np
+import collections
+import time
+
+
+class SentimentService(object):
+
+  def __init__(self, model, tokenizer, max_batch_size=256, pad_to_multiple=32,
+               cache_size=100000):
+    self.tokenizer = tokenizer
+    self.max_batch_size = max_batch_size
+    self.pad_to_multiple = pad_to_multiple
+    self.cache_size = cache_size
+    self.cache = collections.OrderedDict()
+
+    # A single trace serves every batch size and sequence length
+    @tf.function(input_signature=[tf.TensorSpec([None, None], tf.int64)])
+    def forward(tokens):
+      return tf.squeeze(model(tokens, training=False), -1)
+
+    self.forward = forward
+
+  def predict(self, texts):
+    """Positive-sentiment probability of every text in `texts`."""
+    results = {}
+    missing = []
+    for text in texts:
+      if text in self.cache:
+        self.cache.move_to_end(text)
+        results[text] = self.cache[text]
+      elif text not in results:
+        results[text] = None
+        missing.append(text)
+
+    tokenized = [self.tokenizer.encode(text) for text in missing]
+
+    # group the texts by padded length, then run each group in batches
+    groups = collections.defaultdict(list)
+    for text, tokens in zip(missing, tokenized):
+      padded_length = -(-max(len(tokens), 1) // self.pad_to_multiple) * self.pad_to_multiple
+      groups[padded_length].append((text, tokens))
+
+    for padded_length, group in groups.items():
+      for start in range(0, len(group), self.max_batch_size):
+        batch = group[start:start + self.max_batch_size]
+        tokens = np.zeros((len(batch), padded_length), dtype=np.int64)
+        for i, (_, text_tokens) in enumerate(batch):
+          tokens[i, :len(text_tokens)] = text_tokens
+
+        predictions = self.forward(tf.constant(tokens)).numpy()
+        for (text, _), prediction in zip(batch, predictions):
+          results[text] = float(prediction)
+          self._remember(text, float(prediction))
+
+    return [results[text] for text in texts]
+
+  def handle_request(self, payload):
+    """Answer a request payload, see the module docstring."""
+    texts = payload['texts']
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+      raise ValueError('"texts" must be a list of strings')
+    return {'predictions': self.predict(texts)}
+
+  def _remember(self, text, prediction):
+    self.cache[text] = prediction
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last=False)
+
+
+def benchmark(service, texts, batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256), repeats=5):
+  """Latency and throughput of `service.predict` for each batch size, without the cache.
+
+  Returns:
+    list of (batch_size, median latency in ms, texts/sec).
+  """
+  service.predict(texts[:max(batch_sizes)])  # trace and warm up
+
+  rows = []
+  for batch_size in batch_sizes:
+    latencies = []
+    for r in range(repeats):
+      batch = [texts[(r * batch_size + i) % len(texts)] for i in range(batch_size)]
+      service.cache.clear()
+      start = time.time()
+      service.predict(batch)
+      latencies.append(time.time() - start)
+
+    latency = np.median(latencies)
+    rows.append((batch_size, latency * 1000, batch_size / latency))
+    print('batch {:4d}: {:8.2f} ms  {:8.1f} texts/sec'.format(*rows[-1]))
+  return rows
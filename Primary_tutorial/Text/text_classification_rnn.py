@@ -23,6 +23,8 @@ import tensorflow_datasets as tfds
 
 import matplotlib.pyplot as plt
 
+from sentiment_service import SentimentService, benchmark
+
 
 # Create a helper function to plot graphs.
 def plot_graphs(history, string):
@@ -137,6 +139,18 @@ sample_pred_text = ('The movie was cool. The animation and the graphics '
 predictions = sample_predict(sample_pred_text, pad=True)
 print(predictions)
 
+# Serve many predictions at once
+# `sample_predict` pays the `model.predict` setup cost for every single text.
+# SentimentService tokenizes a list of texts, groups them by length, runs each
+# group through one compiled forward pass and caches the results per text.
+service = SentimentService(model, tokenizer)
+print(service.handle_request({'texts': [sample_pred_text,
+                                        'The movie was not good. I would not recommend this movie.']}))
+
+# Latency and throughput for batch sizes from 1 to 256
+benchmark_texts = [tokenizer.decode(text.numpy()) for text, _ in dataset['test'].take(1024)]
+benchmark(service, benchmark_texts)
+
 plot_graphs(history, 'accuracy')
 
 plot_graphs(history, 'loss')
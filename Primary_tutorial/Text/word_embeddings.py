@@ -25,6 +25,9 @@ import matplotlib.pyplot as plt
 
 import io
 
+from embedding_index import EmbeddingIndex
+from imdb_pipeline import EpochTimer, bucket_boundaries, bucketed_dataset, print_comparison
+
 # Keras makes it easy to use word embeddings. Let's take a look at the Embedding layer.
 embedding_layer = layers.Embedding(1000, 32)
 
@@ -60,6 +63,9 @@ def decode_review(text):
 # We will use the pad_sequences function to standardize the lengths of the reviews.
 maxlen = 500
 
+# Keep the unpadded reviews for the bucketed pipeline at the end of this tutorial
+train_sequences = train_data
+
 train_data = tf.keras.preprocessing.sequence.pad_sequences(train_data,
                                                            value=word_index["<PAD>"],
                                                            padding='post',
@@ -99,12 +105,14 @@ model.compile(optimizer=tf.optimizers.Adam(),
               loss=tf.losses.BinaryCrossentropy(),
               metrics=['accuracy'])
 
+padded_timer = EpochTimer()
 history = model.fit(
     train_data,
     train_labels,
     epochs=30,
     batch_size=512,
-    validation_split=0.2)
+    validation_split=0.2,
+    callbacks=[padded_timer])
 
 # With this approach our model reaches a validation accuracy
 # of around 88% (note the model is over-fitting,
@@ -158,6 +166,18 @@ for word_num in range(vocab_size):
 out_v.close()
 out_m.close()
 
+# The learned embeddings can also answer nearest-neighbor queries, for example
+# for query expansion. Instead of scanning the whole vocabulary for every query,
+# EmbeddingIndex clusters the vectors into inverted lists and only scans the
+# lists closest to the query. The index is saved to disk and memory-mapped on load.
+words = [reverse_word_index[word_num] for word_num in range(vocab_size)]
+index = EmbeddingIndex.build(weights, words)
+index.save('embedding_index')
+
+index = EmbeddingIndex.load('embedding_index')
+for word, neighbors in zip(['great', 'awful'], index.most_similar(['great', 'awful'], k=10)):
+    print(word, '->', ', '.join(neighbor for neighbor, _ in neighbors))
+
 # If you are running this tutorial in Colaboratory,
 # you can use the following snippet to download these files to
 # your local machine (or use the file browser,
@@ -169,3 +189,37 @@ except ImportError:
 else:
     files.download('vecs.tsv')
     files.download('meta.tsv')
+
+# Every review above is padded (or truncated) to 500 words, so short reviews pay
+# for the full Embedding + GlobalAveragePooling1D cost and long ones are cut.
+# A bucketed tf.data pipeline groups reviews of similar length and pads each
+# batch only to its longest review. With `mask_zero=True` the padding is masked,
+# and GlobalAveragePooling1D averages over the real words only.
+num_validation = len(train_sequences) // 5
+boundaries = bucket_boundaries(train_sequences)
+
+bucketed_train = bucketed_dataset(train_sequences[:-num_validation], train_labels[:-num_validation],
+                                  boundaries, batch_size=512)
+bucketed_validation = bucketed_dataset(train_sequences[-num_validation:], train_labels[-num_validation:],
+                                       boundaries, batch_size=512, shuffle=False)
+
+bucketed_model = tf.keras.Sequential([
+    layers.Embedding(vocab_size, embedding_dim, mask_zero=True),
+    layers.GlobalAveragePooling1D(),
+    layers.Dense(16, activation=tf.nn.relu),
+    layers.Dense(1, activation=tf.nn.sigmoid)
+])
+
+bucketed_model.compile(optimizer=tf.optimizers.Adam(),
+                       loss=tf.losses.BinaryCrossentropy(),
+                       metrics=['accuracy'])
+
+bucketed_timer = EpochTimer()
+bucketed_history = bucketed_model.fit(
+    bucketed_train,
+    epochs=30,
+    validation_data=bucketed_validation,
+    callbacks=[bucketed_timer])
+
+print_comparison([('padded-500', history, padded_timer),
+                  ('bucketed', bucketed_history, bucketed_timer)])